@@ -17,18 +17,36 @@ def main():
     """
     Main entry point for the program.
     """
+    import sys
+
+    # Run bots for several accounts, given their directories.
+    if sys.argv[1:2] == ["--multi"]:
+        from babbler.multi import main
+        try:
+            main(sys.argv[2:], description=__doc__.strip(),
+                 version=__version__)
+        except KeyboardInterrupt:
+            print
+            print "Quitting"
+        return
+
     from babbler.bot import Bot
     bot = Bot(description=__doc__.strip(), version=__version__)
 
-    if bot.data["options"]["destroy"]:
-        # Reset all data and delete tweets if specified.
-        bot.destroy()
-    elif bot.data["options"]["kill"]:
-        # Kill a previously started daemon.
+    # Killing a daemon only needs its PID file, so check for it before
+    # loading data. Destroying takes priority over killing.
+    options = bot.parse_args()
+    if options["kill"] and not options["destroy"]:
         if bot.kill():
             print "Daemon killed"
         else:
             print "Couldn't kill daemon"
+        return
+
+    bot.load()
+    if bot.data["options"]["destroy"]:
+        # Reset all data and delete tweets if specified.
+        bot.destroy()
     elif bot.data["options"]["edit_data"]:
         # Run a Python shell for editing data.
         bot.edit()
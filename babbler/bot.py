@@ -2,34 +2,73 @@
 from code import interact
 import logging
 from os import getcwd, kill, remove
-from os.path import dirname, join
-
-from daemon import daemonize
-from twitter import Api, TwitterError
+from os.path import dirname, getsize, join
+from signal import signal, SIGKILL, SIGTERM
+from threading import Event, RLock
+from time import sleep, time
 
+from babbler.composer import Composer
+from babbler.destroyer import Destroyer
 from babbler.feed import Feed
+from babbler.metrics import metrics
 from babbler.options import Options
+from babbler.ratelimit import RateLimited, RateLimitedApi
 from babbler.responder import RespondingFeed
+from babbler.scheduler import Scheduler
 from babbler.tagging import Tagger
 from babbler.persistence import PersistentDict
+from babbler.popularity import PopularityIndex
+from babbler.profiler import profiler
 
 
 TWEET_MAX_LEN = 140
 
+# Maximum seconds to wait before retrying a failed post.
+RETRY_PAUSE = 60
+
+# Seconds between refreshing the popularity index, and the maximum
+# number of hashtags searched for on each refresh.
+REFRESH_PAUSE = 15 * 60
+REFRESH_SEARCHES = 20
+
+# Number of threads for running the bot's tasks concurrently.
+TASK_THREADS = 4
+
+# Seconds to wait for a daemon to save its data and exit when killed.
+KILL_TIMEOUT = 30
+
 
 class Bot(object):
 
-    def __init__(self, version=None, description=None):
+    def __init__(self, version=None, description=None, path=None):
         """
-        Handles command-line arg parsing and loading of data.
+        Set up file paths, in the given directory or the current one.
+        Data and options are loaded separately by load(), so that
+        commands that don't need them start quickly.
         """
-        # Set up file paths.
+        self.path = path or getcwd()
         self.package_data_path = join(dirname(__file__), "data")
-        self.data_path = join(getcwd(), "babbler.data")
-        self.pid_path = join(getcwd(), "babbler.pid")
-        self.log_path = join(getcwd(), "babbler.log")
+        self.data_path = join(self.path, "babbler.data")
+        self.pid_path = join(self.path, "babbler.pid")
+        self.log_path = join(self.path, "babbler.log")
+        self.profile_path = join(self.path, "babbler.%s.prof")
+        self.destroy_path = join(self.path, "babbler.destroy")
         self.options_path = join(self.package_data_path, "options.yml")
         self.eliza_path = join(self.package_data_path, "eliza.yml")
+        self.version = version
+        self.description = description
+        self.api = None
+        self.options = None
+        # Set on SIGTERM, to stop waiting for rate limits.
+        self.stopped = Event()
+        # Held while changing the feed or saving the data.
+        self.lock = RLock()
+
+    def load(self, args=None):
+        """
+        Handles command-line arg parsing and loading of data. Args are
+        read from the command line unless given.
+        """
         # Load persisted data.
         self.data = PersistentDict(path=self.data_path)
         existing_options = {}
@@ -40,9 +79,10 @@ class Bot(object):
                 self.data["feed"] = RespondingFeed()
                 self.data["feed"].todo = self.data.pop("todo")
                 self.data["feed"].done = self.data.pop("done")
-            # Migrate from 0.2 format.
-            feed = self.data["feed"]
-            if isinstance(feed, Feed):
+            # Migrate from 0.2 format, where the feed was a Feed rather
+            # than a RespondingFeed, which is a subclass of it.
+            feed = self.data.get("feed")
+            if type(feed) is Feed:
                 self.data["feed"] = RespondingFeed()
                 self.data["feed"].todo = feed.todo
                 self.data["feed"].done = feed.done
@@ -50,112 +90,420 @@ class Bot(object):
             print
             print "Initial setup. Data will be saved to '%s'" % self.data_path
             print
-        # Load options.
-        options = Options(self.options_path, existing=existing_options,
-                          description=description, version=version)
-        self.data["options"] = options.parse_args()
+        # Load options, reusing those parsed by parse_args() if any.
+        options = self.options
+        if options is None:
+            options = Options(self.options_path, description=self.description,
+                              version=self.version)
+        options.update_defaults(existing_options)
+        self.data["options"] = options.parse_args(args)
         self.data.save()
-        # Set up the Twitter API object.
-        api = Api(**dict([(k, v) for k, v in self.data["options"].items()
-                          if k.split("_")[0] in ("consumer", "access")]))
-        self.twitter = api
 
-    def run(self, as_daemon=False):
+    def parse_args(self, args=None):
         """
-        Main event loop that gets the entries from the feed and posts them
-        to Twitter.
+        Parses the command-line args without loading data, or prompting
+        for missing options, so that commands that don't need data can
+        be checked for before loading it. Args are read from the
+        command line unless given.
+        """
+        self.options = Options(self.options_path,
+                               description=self.description,
+                               version=self.version)
+        return self.options.parse_args(args, prompt=False)
+
+    @property
+    def twitter(self):
+        """
+        The Twitter API object, created on first use, and wrapped so
+        that requests are kept within Twitter's rate limits.
+        """
+        if self.api is None:
+            from twitter import Api
+            auth = dict([(k, v) for k, v in self.data["options"].items()
+                         if k.split("_")[0] in ("consumer", "access")])
+            self.api = RateLimitedApi(Api(**auth), stopped=self.stopped)
+        return self.api
+
+    def start(self, as_daemon=False):
+        """
+        Sets up the process and the bot prior to running the main
+        event loop.
+        """
+        self.start_process(as_daemon)
+        self.setup()
+
+    def start_process(self, as_daemon=False):
+        """
+        Sets up logging, daemonizing, metrics and profiling, which are
+        shared by all bots in the process.
         """
         # Set up logging.
         logger_args = {"format": "%(asctime)-15s %(levelname)-5s %(message)s"}
         if as_daemon:
+            from daemon import daemonize
             self.kill()
             daemonize(self.pid_path)
             logger_args.update({"filename": self.log_path, "filemode": "wb"})
+        # Serve metrics, after daemonizing so the server thread runs in
+        # the daemon process.
+        if self.data["options"]["metrics_port"]:
+            metrics.serve(self.data["options"]["metrics_port"])
+        profiler.setup(self.data["options"]["timing"],
+                       self.data["options"]["profile"], self.profile_path)
         logging.basicConfig(**logger_args)
         log_level = getattr(logging, self.data["options"]["log_level"])
         logging.getLogger().setLevel(log_level)
-        logging.debug("\n\nUsing options:\n\n%s\n" % self.data["options"])
+
+    def setup(self):
+        """
+        Sets up the feed, hashtagging and metrics for the bot.
+        """
+        logging.debug("\n\nUsing options for %s:\n\n%s\n" %
+                      (self.path, self.data["options"]))
+        metrics.collect(self.collect_metrics)
+        # Set up the hashtag popularity index.
+        options = self.data["options"]
+        self.data.setdefault("popularity", PopularityIndex())
+        self.data["popularity"].setup(half_life=options["half_life"],
+                                      ttl=options["cache_ttl"],
+                                      size=options["cache_size"])
         # Set up the feed.
         self.data.setdefault("feed", RespondingFeed())
         feed_options = dict(twitter=self.twitter, max_len=TWEET_MAX_LEN,
-                            eliza_path=self.eliza_path, **self.data["options"])
+                            eliza_path=self.eliza_path,
+                            popularity=self.data["popularity"], **options)
         self.data["feed"].setup(feed_options)
         self.data.save()
         # Set up hashtagging.
-        tagger = Tagger(scorer=self.hashtag_score,
-                        data_path=self.package_data_path,
-                        min_length=self.data["options"]["hashtag_min_length"])
-        # Main loop.
+        self.tagger = Tagger(scorer=self.hashtag_score,
+                             data_path=self.package_data_path,
+                             min_length=options["hashtag_min_length"],
+                             concurrency=options["concurrency"])
+        # Compose tweets for entries queued before they were composed.
+        self.composer = Composer(self.compose, self.tagger.tags_many,
+                                 self.wanted_tags)
+        feed = self.data["feed"]
+        self.composer.add([e for e in list(feed.replies) + list(feed.todo)
+                           if "tweet" not in e])
+
+    def run(self, as_daemon=False):
+        """
+        Main event loop that polls the feeds and mentions, and posts
+        queued entries to Twitter, each on their own timer. If the
+        concurrent option is set, the tasks run in a pool of threads,
+        so that requests to feeds and Twitter made by each task don't
+        hold up the others. Stops on SIGTERM, saving the data once
+        running tasks have finished.
+        """
+        self.start(as_daemon)
+        pool = None
+        if self.data["options"]["concurrent"]:
+            from multiprocessing.pool import ThreadPool
+            pool = ThreadPool(TASK_THREADS)
+        self.schedule(Scheduler(pool=pool))
+        signal(SIGTERM, self.terminate)
         try:
-            for entry in self.data["feed"]:
-                try:
-                    # Twitter reply.
-                    tweet = "%s %s" % (entry["to"], entry["title"])
-                    reply_to = entry["id"]
-                except KeyError:
-                    # Feed entry.
-                    tweet = entry["title"]
-                    reply_to = None
-                for tag in tagger.tags(entry["title"]):
-                    tag = " #" + tag
-                    # Extra check to ensure tag isn't already in the tweet.
-                    if (len(tweet + tag) <= TWEET_MAX_LEN and
-                        tag.strip().lower() not in tweet.lower()):
-                        tweet += tag
-                # Post to Twitter.
-                done = True
-                try:
-                    if not self.data["options"]["dry_run"]:
-                        self.twitter.PostUpdate(tweet, reply_to)
-                except Exception, e:
-                    logging.error("Error tweeting '%s': %s" % (tweet, e))
-                    # Mark the entry as done if it's a duplicate.
-                    done = str(e) == "Status is a duplicate."
-                if done:
-                    logging.info("Tweeted: %s" % tweet)
-                    # Move the entry from "todo" to "done" and save.
-                    self.data["feed"].process()
-                    if not self.data["options"]["dry_run"]:
-                        self.data.save()
+            self.scheduler.run()
         except Exception, e:
             logging.critical("Shutting down on unhandled error: %s" % e)
+        self.stop()
+
+    def schedule(self, scheduler, prefix=""):
+        """
+        Adds tasks for polling the feeds and mentions, and posting, to
+        the scheduler, named with the given prefix. Tasks only hold the
+        bot's lock while changing the feed, so that when the scheduler
+        runs them in a pool of threads, they make requests concurrently.
+        """
+        self.scheduler = scheduler
+        self.prefix = prefix
+        for name, task in (("feeds", self.poll_feeds),
+                           ("mentions", self.poll_mentions),
+                           ("post", self.post),
+                           ("popularity", self.refresh_popularity)):
+            scheduler.add(prefix + name, task)
+
+    def terminate(self, *args):
+        """
+        Stops the scheduler, and stops tasks waiting for rate limits,
+        so that they finish before the daemon is killed. Takes any args
+        so that it can be used as a signal handler.
+        """
+        self.stopped.set()
+        self.scheduler.stop()
+
+    def stop(self):
+        """
+        Waits for running tasks to finish once the scheduler has
+        stopped, then flushes the bot's data.
+        """
+        running = self.scheduler.join()
+        if running:
+            logging.error("Stopping with tasks running: %s" %
+                          ", ".join(running))
+        self.flush()
+
+    def flush(self):
+        """
+        Stores tweets composed since they were last collected, and
+        saves the data.
+        """
+        with self.lock:
+            self.data["feed"].composed(self.composer.composed())
+            if not self.data["options"]["dry_run"]:
+                self.save()
+        logging.info("Stopped %s" % self.path)
+
+    def poll_feeds(self):
+        """
+        Queues new feed entries, returning the seconds until the feeds
+        are next requested.
+        """
+        feed = self.data["feed"]
+        with profiler.stage("feeds"):
+            polled = feed.poll()
+        with self.lock:
+            self.queue(feed.entries(polled))
+        return feed.pause
+
+    def poll_mentions(self):
+        """
+        Queues replies to new mentions, returning the seconds until
+        mentions are next requested.
+        """
+        feed = self.data["feed"]
+        with profiler.stage("mentions"):
+            polled = feed.poll_mentions()
+        with self.lock:
+            self.queue(feed.mention_entries(polled))
+        return self.data["options"]["mention_pause"]
+
+    def queue(self, entries):
+        """
+        Queues and saves new entries, posting straight away if they're
+        replies or nothing was queued, and adds them to be composed.
+        The bot's lock must be held.
+        """
+        logging.debug("New queued entries: %s" % len(entries))
+        if not entries:
+            return
+        feed = self.data["feed"]
+        if feed.head() is None or [e for e in entries if "to" in e]:
+            self.scheduler.wake(self.prefix + "post")
+        feed.queue(entries)
+        self.composer.add(entries)
+        if not self.data["options"]["dry_run"]:
+            self.save()
+
+    def compose(self, entry, tags=None):
+        """
+        Returns the tweet for an entry with hashtags added, and the ID
+        of the tweet it replies to, if any. The entry's tags can be
+        given if they've already been chosen.
+        """
+        try:
+            # Twitter reply.
+            tweet = "%s %s" % (entry["to"], entry["title"])
+            reply_to = entry["id"]
+        except KeyError:
+            # Feed entry.
+            tweet = entry["title"]
+            reply_to = None
+        added = 0
+        with profiler.stage("compose"):
+            if tags is None:
+                tags = self.tagger.tags(entry["title"])
+            for tag in tags:
+                tag = " #" + tag
+                # Extra check to ensure tag isn't already in the tweet.
+                if (len(tweet + tag) <= TWEET_MAX_LEN and
+                    tag.strip().lower() not in tweet.lower()):
+                    tweet += tag
+                    added += 1
+        metrics.observe("babbler_tweet_tags", added, buckets=range(6))
+        return tweet, reply_to
+
+    def composed(self, entry):
+        """
+        Returns the tweet composed for an entry and the ID of the tweet
+        it replies to. The entry is composed again if it hasn't been
+        composed yet, its hashtags were scored longer ago than the
+        cache_ttl option, or any of the hashtags that were waiting to
+        be searched for when it was composed have since been searched.
+        """
+        age = time() - entry.get("composed", 0)
+        wanted = entry.get("wanted", [])
+        searched = (wanted and
+                    self.data["popularity"].wanted(wanted) != wanted)
+        if ("tweet" not in entry or age > self.data["options"]["cache_ttl"]
+                or searched):
+            return self.compose(entry)
+        return entry["tweet"], entry["id"] if "to" in entry else None
+
+    def wanted_tags(self, title):
+        """
+        Returns the possible hashtags for a title that are waiting to
+        be searched for by the next refresh of the popularity index.
+        """
+        possible = [t for _, p in self.tagger.candidates(title) for t in p]
+        return self.data["popularity"].wanted(possible)
+
+    def post(self):
+        """
+        Posts the next queued entry to Twitter, returning the seconds
+        until the next entry should be posted. Replies are posted
+        straight away, feed entries are paced by the feed's delay, and
+        failed posts are retried sooner.
+        """
+        feed = self.data["feed"]
+        with self.lock:
+            feed.composed(self.composer.composed())
+            entry = feed.head()
+            if entry is None:
+                return feed.delay()
+        tweet, reply_to = self.composed(entry)
+        done = True
+        try:
+            if not self.data["options"]["dry_run"]:
+                with profiler.stage("post"):
+                    self.twitter.PostUpdate(tweet, reply_to)
+        except Exception, e:
+            logging.error("Error tweeting '%s': %s" % (tweet, e))
+            # Mark the entry as done if it's a duplicate.
+            done = str(e) == "Status is a duplicate."
+        if not done:
+            return min(RETRY_PAUSE, feed.delay())
+        logging.info("Tweeted: %s" % tweet)
+        # Move the entry from "todo" to "done" and save. Other entries
+        # may have been queued ahead of it while posting, so the entry
+        # is given.
+        with self.lock:
+            feed.process(entry)
+            if not self.data["options"]["dry_run"]:
+                self.save()
+            logging.debug("Queued entries: %s" % feed.stats())
+            if feed.replies:
+                return 0
+            return feed.delay()
+
+    def save(self):
+        """
+        Saves the data file, recording the time taken.
+        """
+        with self.lock, metrics.timer("babbler_save_seconds"):
+            with profiler.stage("save"):
+                self.data.save()
+
+    def collect_metrics(self, metrics):
+        """
+        Sets gauges for the sizes of the queues, "done" set, popularity
+        index and data files when metrics are requested, labelled with
+        the bot's directory.
+        """
+        bot = self.path
+        stats = self.data["feed"].stats()
+        for queue in ("todo", "replies"):
+            metrics.set("babbler_queued_entries", stats[queue], bot=bot,
+                        queue=queue)
+        metrics.set("babbler_drain_seconds", stats["drain_time"], bot=bot)
+        metrics.set("babbler_done_entries", len(self.data["feed"].done),
+                    bot=bot)
+        metrics.set("babbler_popular_tags", len(self.data["popularity"]),
+                    bot=bot)
+        for path in (self.data.path, self.data.journal_path):
+            try:
+                size = getsize(path)
+            except OSError:
+                size = 0
+            metrics.set("babbler_data_file_bytes", size, path=path)
 
     def hashtag_score(self, hashtag):
         """
-        Searchs Twitter for the given hashtag, and creates a score for
-        it based on the age of each search result.
+        Scores the hashtag by how often it's been seen in tweets, using
+        the popularity index. Hashtags that haven't been seen score 0,
+        and are marked to be searched for by the next refresh, so that
+        composing tweets never waits on a search. Hashtags found in the
+        index and those that aren't are counted.
+        """
+        popularity = self.data["popularity"]
+        score = popularity.score(hashtag)
+        if score is None:
+            metrics.inc("babbler_hashtag_scores_total", result="cold")
+            popularity.want(hashtag)
+            score = 0
+        else:
+            metrics.inc("babbler_hashtag_scores_total", result="hit")
+        return score
+
+    def search(self, hashtag):
+        """
+        Searchs Twitter for the given hashtag, and adds each result
+        to the popularity index, along with the other hashtags in the
+        results.
         """
+        results = self.twitter.GetSearch("#" + hashtag)
+        seen = [(hashtag, t.created_at_in_seconds) for t in results]
+        seen += [(h.text, t.created_at_in_seconds)
+                 for t in results for h in t.hashtags or []
+                 if h.text.lower() != hashtag.lower()]
+        popularity = self.data["popularity"]
+        if seen:
+            popularity.seen(seen)
+        popularity.searched(hashtag)
+
+    def refresh_popularity(self):
+        """
+        Adds the hashtags in new tweets from the home timeline to the
+        popularity index, and searches for hashtags that are wanted or
+        whose searches have expired. Returns the seconds until the
+        next refresh.
+        """
+        popularity = self.data["popularity"]
         try:
-            results = self.twitter.GetSearch("#" + hashtag)
+            tweets = self.twitter.GetHomeTimeline(
+                count=200, since_id=popularity.since_id)
         except Exception, e:
-            logging.error("Error searching for tag '%s': %s" % (hashtag, e))
+            logging.error("Error getting timeline: %s" % e)
         else:
-            return sum([t.created_at_in_seconds for t in results])
-        return 0
+            since_id = popularity.statuses(tweets)
+            if since_id:
+                popularity.set_since_id(since_id)
+        for hashtag in popularity.stale(REFRESH_SEARCHES):
+            try:
+                self.search(hashtag)
+            except RateLimited:
+                break
+            except Exception, e:
+                logging.error("Error searching for tag '%s': %s" %
+                              (hashtag, e))
+        if not self.data["options"]["dry_run"]:
+            self.save()
+        return REFRESH_PAUSE
 
     def destroy(self):
         """
-        Destroys persisted data file and deletes all tweets from Twitter
-        when the --DESTROY option is given.
+        Deletes all tweets from Twitter and then the persisted data
+        file when the --DESTROY option is given. An interrupted run
+        resumes deleting tweets where it stopped.
         """
         print
         print "WARNING: You have specified the --DESTROY option."
         print "All tweets will be deleted from your account."
         if raw_input("Enter 'y' to continue. ").strip().lower() == "y":
             print "Deleting all data and tweets."
+            destroyer = Destroyer(self.twitter, self.destroy_path)
+            deleted, total, errors, seconds = destroyer.run()
             try:
                 self.data.remove()
             except OSError:
                 pass
-            while True:
-                tweets = self.twitter.GetUserTimeline()
-                if not tweets:
-                    break
-                for tweet in tweets:
-                    try:
-                        self.twitter.DestroyStatus(tweet.id)
-                    except TwitterError:
-                        pass
+            print "Deleted %s tweets in %.0f seconds (%.1f per second)." % (
+                deleted, seconds, deleted / seconds if seconds else 0)
+            if total != deleted:
+                print "Deleted %s tweets in total, including earlier runs." % (
+                    total)
+            for error, count in sorted(errors.items()):
+                print "Failed to delete %s tweets: %s" % (count, error)
             print "Done."
         else:
             print "--DESTROY aborted"
@@ -169,28 +517,50 @@ class Bot(object):
         print "'bot.data' which contains the follwing entries:"
         print
         print "All entry IDs that have either been posted or ignored:"
-        print "bot.data['feed'].done = set()"
+        print "bot.data['feed'].done = SeenSet()"
         print
         print "All entries that have been retrieved from the feed and "
         print "are waiting to be posted to Twitter. Each dict contains "
-        print "'id' and 'title' keys:"
-        print "bot.data['feed'].todo = []"
+        print "'id' and 'title' keys, and once composed, 'tweet', "
+        print "'composed' and 'wanted' keys for the tweet, the time "
+        print "composed and the hashtags it was waiting on searches for:"
+        print "bot.data['feed'].todo = deque()"
+        print
+        print "Replies to mentions waiting to be posted, before entries "
+        print "in 'todo'. Each dict also contains a 'to' key:"
+        print "bot.data['feed'].replies = deque()"
         print
         print "All options that have been persisted:"
         print "bot.data['options'] = {}"
         print
-        print "Call the 'bot.data.save()' method to persist changes made."
+        print "Time-decayed counts of hashtags seen in tweets:"
+        print "bot.data['popularity'] = PopularityIndex()"
+        print
+        print "Call the 'bot.data.compact()' method to persist changes made."
         print
         interact(local={"bot": self})
 
     def kill(self):
         """
-        Try to stop a previously started daemon.
+        Try to stop a previously started daemon. It's sent SIGTERM so
+        that it saves its data, and is only killed outright if it
+        hasn't exited after KILL_TIMEOUT seconds.
         """
         try:
             with open(self.pid_path) as f:
-                kill(int(f.read()), 9)
-            remove(self.pid_path)
-        except (IOError, OSError):
+                pid = int(f.read())
+            kill(pid, SIGTERM)
+        except (IOError, OSError, ValueError):
             return False
+        try:
+            for _ in range(KILL_TIMEOUT):
+                sleep(1)
+                kill(pid, 0)
+            kill(pid, SIGKILL)
+        except OSError:
+            pass
+        try:
+            remove(self.pid_path)
+        except OSError:
+            pass
         return True
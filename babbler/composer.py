@@ -0,0 +1,57 @@
+import logging
+from Queue import Empty, Queue
+from threading import Thread
+from time import time
+
+
+class Composer(object):
+    """
+    Composes tweets for entries in a background thread as they're
+    queued, so that hashtag searches aren't made when entries are
+    posted. Each batch of entries added is tagged together. Composed
+    tweets are collected with composed(), so that the feed is only
+    ever changed from the main thread. The hashtags for each entry
+    that haven't been searched for yet are collected with its tweet,
+    so that it can be composed again once they have been.
+    """
+
+    def __init__(self, compose, tags_many, wanted):
+        self.compose = compose
+        self.tags_many = tags_many
+        self.wanted = wanted
+        self.todo = Queue()
+        self.done = Queue()
+        thread = Thread(target=self.run)
+        thread.daemon = True
+        thread.start()
+
+    def add(self, entries):
+        """
+        Adds a batch of entries to be composed.
+        """
+        if entries:
+            self.todo.put(list(entries))
+
+    def run(self):
+        while True:
+            entries = self.todo.get()
+            try:
+                tags = self.tags_many([entry["title"] for entry in entries])
+                for entry, entry_tags in zip(entries, tags):
+                    tweet = self.compose(entry, entry_tags)[0]
+                    wanted = self.wanted(entry["title"])
+                    self.done.put((entry["id"], tweet, time(), wanted))
+            except Exception, e:
+                logging.error("Error composing entries: %s" % e)
+
+    def composed(self):
+        """
+        Returns the entry ID, tweet, time composed and wanted hashtags
+        for each tweet composed since the last call.
+        """
+        composed = []
+        while True:
+            try:
+                composed.append(self.done.get_nowait())
+            except Empty:
+                return composed
@@ -0,0 +1,99 @@
+from collections import defaultdict
+import logging
+from os import remove, rename
+from time import time
+
+
+# Number of tweets requested per page of the timeline, and the number
+# of tweets deleted concurrently.
+PAGE_SIZE = 200
+WORKERS = 8
+
+
+class Destroyer(object):
+    """
+    Deletes all tweets from the account. The timeline is walked a page
+    at a time using max_id, with each page deleted concurrently by a
+    pool of threads. The position reached is saved to a checkpoint
+    file after each page, so that an interrupted run resumes from it.
+    """
+
+    def __init__(self, twitter, checkpoint_path, workers=WORKERS,
+                 page_size=PAGE_SIZE):
+        self.twitter = twitter
+        self.checkpoint_path = checkpoint_path
+        self.workers = workers
+        self.page_size = page_size
+        self.max_id = None
+        self.deleted = 0
+        self.errors = defaultdict(int)
+
+    def load(self):
+        """
+        Loads the position and counts from the checkpoint file,
+        returning True if there was one.
+        """
+        try:
+            with open(self.checkpoint_path) as f:
+                max_id, deleted = map(int, f.read().split())
+        except (IOError, ValueError):
+            return False
+        self.max_id, self.deleted = max_id, deleted
+        return True
+
+    def save(self):
+        """
+        Writes the checkpoint file, via a temporary file so that an
+        interrupted write leaves the previous checkpoint intact.
+        """
+        tmp_path = self.checkpoint_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            f.write("%s %s" % (self.max_id, self.deleted))
+        rename(tmp_path, self.checkpoint_path)
+
+    def delete(self, tweet_id):
+        """
+        Deletes a tweet, returning the error message if it fails.
+        """
+        try:
+            self.twitter.DestroyStatus(tweet_id)
+        except Exception, e:
+            return str(e)
+
+    def run(self):
+        """
+        Deletes each page of the timeline until there are no tweets
+        left, then removes the checkpoint file. Returns the number of
+        tweets deleted by this run, the total deleted including any
+        earlier runs resumed from, the failures for each error message,
+        and the seconds taken by this run.
+        """
+        from multiprocessing.pool import ThreadPool
+        if self.load():
+            logging.info("Resuming from tweet ID %s" % self.max_id)
+        resumed = self.deleted
+        start = time()
+        pool = ThreadPool(self.workers)
+        try:
+            while True:
+                page = self.twitter.GetUserTimeline(count=self.page_size,
+                                                    max_id=self.max_id)
+                if not page:
+                    break
+                ids = [tweet.id for tweet in page]
+                for error in pool.map(self.delete, ids):
+                    if error is None:
+                        self.deleted += 1
+                    else:
+                        self.errors[error] += 1
+                self.max_id = min(ids) - 1
+                self.save()
+                logging.info("Deleted %s tweets" % self.deleted)
+        finally:
+            pool.terminate()
+        try:
+            remove(self.checkpoint_path)
+        except OSError:
+            pass
+        return (self.deleted - resumed, self.deleted, dict(self.errors),
+                time() - start)
@@ -0,0 +1,141 @@
+from collections import deque
+from math import ceil
+import re
+
+
+URL = re.compile(r"https?://\S+")
+NON_WORD = re.compile(r"\W+", re.UNICODE)
+
+
+def normalize(title):
+    """
+    Lowercases a title and strips URLs and punctuation from it, so
+    that titles differing only by these are the same.
+    """
+    title = URL.sub(" ", title.lower())
+    return NON_WORD.sub(" ", title).strip()
+
+
+def title_words(title):
+    """
+    Returns the set of words in a normalized title.
+    """
+    return frozenset(normalize(title).split())
+
+
+class TitleIndex(object):
+    """
+    The most recently queued titles, for finding titles that are the
+    same or nearly the same as one already queued. Titles are near
+    duplicates if the Jaccard similarity of their words - the number
+    of words they share out of all the words in either - is at least
+    the similarity given. Near duplicates must share enough words
+    that, with each title's words ordered longest first, they share
+    one of the first few words of each, so titles are only indexed by
+    those words, and only titles sharing one of them are compared.
+    Short common words come last, so they're rarely indexed.
+    Once the maximum size is reached, the oldest titles are removed,
+    and a size of 0 turns the index off.
+    """
+
+    def __init__(self, size=5000, similarity=0.75):
+        self.size = size
+        self.similarity = similarity
+        self.titles = deque()
+        self.reindex()
+
+    def __getstate__(self):
+        """
+        The words of each title are indexed again when loaded, so
+        aren't persisted.
+        """
+        state = dict(self.__dict__)
+        del state["keys"]
+        del state["index"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.reindex()
+
+    def __len__(self):
+        return len(self.titles)
+
+    def setup(self, size, similarity):
+        """
+        Set up options, indexing the titles again if the similarity
+        has changed, and removing titles if the size has been reduced.
+        """
+        self.size = size
+        if similarity != self.similarity:
+            self.similarity = similarity
+            self.reindex()
+        self.evict()
+
+    def reindex(self):
+        """
+        Build the mapping of each title's set of words to the title,
+        and the index of words mapped to the sets they start.
+        """
+        self.keys = {}
+        self.index = {}
+        for title in self.titles:
+            words = title_words(title)
+            self.keys[words] = title
+            for word in self.prefix(words):
+                self.index.setdefault(word, set()).add(words)
+
+    def prefix(self, words):
+        """
+        Returns the first words of a set, longest first, one of which
+        must be shared by any near duplicate - one more than the number
+        of words that could be left out of the words they share.
+        """
+        shared = int(ceil(self.similarity * len(words) - 1e-9))
+        ordered = sorted(words, key=lambda word: (-len(word), word))
+        return ordered[:max(len(words) - shared + 1, 1)]
+
+    def match(self, title):
+        """
+        Returns the indexed title that the title is most similar to,
+        if it's a near duplicate of it, otherwise None.
+        """
+        words = title_words(title)
+        if not words or not self.size:
+            return None
+        others = set()
+        for word in self.prefix(words):
+            others.update(self.index.get(word, ()))
+        best = None
+        highest = self.similarity
+        for other in others:
+            shared = len(words & other)
+            similarity = shared / float(len(words) + len(other) - shared)
+            if similarity >= highest:
+                best = other
+                highest = similarity
+        return self.keys.get(best)
+
+    def add(self, title):
+        """
+        Adds the title, unless one with the same words is already
+        indexed.
+        """
+        words = title_words(title)
+        if not words or not self.size or words in self.keys:
+            return
+        self.titles.append(title)
+        self.keys[words] = title
+        for word in self.prefix(words):
+            self.index.setdefault(word, set()).add(words)
+        self.evict()
+
+    def evict(self):
+        while len(self.titles) > self.size:
+            words = title_words(self.titles.popleft())
+            del self.keys[words]
+            for word in self.prefix(words):
+                others = self.index[word]
+                others.discard(words)
+                if not others:
+                    del self.index[word]
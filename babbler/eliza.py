@@ -0,0 +1,122 @@
+from random import choice
+import re
+from string import punctuation
+
+
+# Characters that end the literal prefix of a pattern, and those that
+# make the character before them optional.
+SPECIAL = ".^$*+?{}[]|()\\"
+OPTIONAL = "*?{"
+
+# Compiled grammars, keyed by path, shared by all feeds.
+grammars = {}
+
+
+def literal_prefix(pattern):
+    """
+    Returns the lowercased literal text that a match for the pattern
+    must start with.
+    """
+    prefix = ""
+    for c in pattern:
+        if c in SPECIAL:
+            if c in OPTIONAL:
+                prefix = prefix[:-1]
+            break
+        prefix += c
+    return prefix.lower()
+
+
+def split_template(response):
+    """
+    Splits a response into a list of literal strings and the group
+    numbers of %N tokens.
+    """
+    parts = re.split(r"(%\d)", response)
+    return [int(p[1:]) if i % 2 else p for i, p in enumerate(parts)]
+
+
+def load(path):
+    """
+    Returns the compiled grammar for the path, compiling it on first
+    use.
+    """
+    if path not in grammars:
+        grammars[path] = Eliza(path)
+    return grammars[path]
+
+
+class Eliza(object):
+    """
+    Compiled Eliza grammar. Patterns are indexed by the first character
+    of their literal prefix, so that only patterns that could match the
+    text are tried, and responses are pre-split into literal strings
+    and group numbers.
+    """
+
+    def __init__(self, path):
+        from yaml import load
+        with open(path) as f:
+            grammar = load(f)
+        self.reflections = grammar["reflections"]
+        self.patterns = []
+        for item in grammar["patterns"]:
+            pattern, responses = item.items()[0]
+            self.patterns.append((literal_prefix(pattern),
+                                  re.compile(pattern, re.IGNORECASE),
+                                  [split_template(r) for r in responses]))
+        # Patterns without a prefix are tried for all text, so they're
+        # included in each index entry, keeping the original order.
+        self.unprefixed = [p for p in self.patterns if not p[0]]
+        self.index = {}
+        for c in set([p[0][0] for p in self.patterns if p[0]]):
+            self.index[c] = [p for p in self.patterns
+                             if not p[0] or p[0][0] == c]
+
+    def reflect(self, text):
+        """
+        Switch reflections in the text, eg "my" becomes "your".
+        """
+        words = (text or "").lower().split()
+        return " ".join([self.reflections.get(w, w) for w in words])
+
+    def render(self, template, match):
+        """
+        Fill in the template with the reflected groups from the match,
+        and remove extraneous punctuation from the end.
+        """
+        response = "".join([self.reflect(match.group(p))
+                            if isinstance(p, int) else p for p in template])
+        stripped = response.rstrip(punctuation)
+        if len(stripped) + 1 < len(response):
+            response = stripped + response[-1]
+        return response
+
+    def match(self, text):
+        """
+        Returns the match and templates for the first pattern that
+        matches the text.
+        """
+        lowered = text.lower()
+        for prefix, pattern, templates in self.index.get(lowered[:1],
+                                                         self.unprefixed):
+            if lowered.startswith(prefix):
+                match = pattern.match(text)
+                if match:
+                    return match, templates
+        return None, None
+
+    def response(self, text, max_len=None):
+        """
+        Returns a random response for the first pattern that matches
+        the text, chosen from the responses no longer than max_len if
+        given.
+        """
+        match, templates = self.match(text)
+        if match is None:
+            return None
+        responses = [self.render(t, match) for t in templates]
+        if max_len is not None:
+            responses = [r for r in responses if len(r) <= max_len]
+        if responses:
+            return choice(responses)
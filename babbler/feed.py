@@ -1,100 +1,387 @@
 
+from collections import deque
+from itertools import izip_longest
 import logging
 from math import ceil
-from time import sleep, time
+import re
+from time import time
 
-from feedparser import parse
+from babbler.duplicates import TitleIndex
+from babbler.metrics import metrics
+from babbler.seen import SeenSet
+
+
+# Attributes that are set up on each run and aren't persisted.
+TRANSIENT = ("journal", "queued", "pool", "polled",
+             "ignore_compiled", "ignore_strings", "ignore_pattern")
+
+
+def fetch(parse, url, *args, **kwargs):
+    """
+    Calls the parse function for a feed URL, recording the time taken.
+    """
+    with metrics.timer("babbler_feed_fetch_seconds", url=url):
+        return parse(url, *args, **kwargs)
 
 
 class Feed(object):
     """
-    Generator that requests entries for an RSS feed, returning each
-    while pausing between each entry returned.
+    Requests entries for one or more RSS feeds, queuing new entries
+    to be posted. Replies are queued separately and take priority over
+    feed entries. Entries whose titles are near duplicates of recently
+    queued titles are dropped.
     """
 
     def __init__(self):
-        self.todo = []
-        self.done = set()
+        self.todo = deque()
+        self.replies = deque()
+        self.done = SeenSet()
+        self.titles = TitleIndex()
+        self.validators = {}
+        self.setup_transient()
+
+    def __getstate__(self):
+        """
+        The journal of changes, the index of queued entries and the
+        state of feed requests aren't persisted with the feed.
+        """
+        state = dict(self.__dict__)
+        for name in TRANSIENT:
+            state.pop(name, None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.__dict__.setdefault("validators", {})
+        self.__dict__.setdefault("replies", deque())
+        self.__dict__.setdefault("titles", TitleIndex())
+        self.setup_transient()
+        self.reindex()
+
+    def setup_transient(self):
+        """
+        Set up the attributes that aren't persisted.
+        """
+        self.journal = []
+        self.queued = {}
+        self.pool = None
+        self.polled = {}
+        self.ignore_compiled = None
+        self.ignore_strings = []
+        self.ignore_pattern = None
+
+    def reindex(self):
+        """
+        Build the index of IDs in the "todo" and "replies" queues mapped
+        to entries, migrating the queue from a list and the "done" set
+        from a set of IDs if required, and moving replies from the
+        "todo" queue to the "replies" queue.
+        """
+        if not isinstance(self.todo, deque):
+            self.todo = deque(self.todo)
+        replies = [e for e in self.todo if "to" in e]
+        if replies:
+            self.replies.extend(replies)
+            self.todo = deque([e for e in self.todo if "to" not in e])
+        if not isinstance(self.done, SeenSet):
+            self.done = SeenSet(self.done)
+        self.queued = dict([(e["id"], e) for e in self.todo])
+        self.queued.update([(e["id"], e) for e in self.replies])
 
     def setup(self, options):
         """
-        Set up options.
+        Set up options. The feed_url option contains comma separated
+        feed URLs, each of which can be given its own pause and timeout
+        in seconds using the format "url|pause|timeout".
         """
         self.feed_url = options["feed_url"]
-        self.pause = options["pause"]
+        self.feeds = []
+        for feed_url in self.feed_url.split(","):
+            url, _, rest = feed_url.strip().partition("|")
+            pause, _, timeout = rest.partition("|")
+            if url:
+                self.feeds.append((url, int(pause or options["pause"]),
+                                   int(timeout or options["feed_timeout"])))
+        self.pause = min([pause for _, pause, _ in self.feeds])
+        self.stream_run = options["stream_run"]
+        from multiprocessing.pool import ThreadPool
+        self.pool = ThreadPool(len(self.feeds))
         self.queue_slice = options["queue_slice"]
         self.max_len = options["max_len"]
         self.ignore = options["ignore"]
+        if self.ignore != self.ignore_compiled:
+            self.compile_ignore()
+        self.reindex()
+        self.done.setup(options["done_horizon"] * 86400)
+        self.titles.setup(options["duplicate_size"],
+                          options["duplicate_similarity"])
 
-    def saved(self):
-        return set([t["id"] for t in self.todo]) | self.done
+    def compile_ignore(self):
+        """
+        Compile the ignore strings into a single regex that matches
+        any of them, longest first.
+        """
+        strings = []
+        if self.ignore:
+            strings = [s for s in self.ignore.split(",") if s]
+        self.ignore_strings = strings
+        self.ignore_pattern = None
+        if strings:
+            lowered = set([s.lower() for s in strings])
+            lowered = sorted(lowered, key=len, reverse=True)
+            self.ignore_pattern = re.compile("|".join(map(re.escape, lowered)))
+        self.ignore_compiled = self.ignore
+
+    def ignored(self, title):
+        """
+        Returns the ignore strings found in the title.
+        """
+        title = title.lower()
+        pattern = self.ignore_pattern
+        if pattern is None or not pattern.search(title):
+            return []
+        return [s for s in self.ignore_strings if s.lower() in title]
+
+    def seen(self, entry_id):
+        """
+        Returns True if the entry ID is queued or in the "done" set.
+        """
+        return entry_id in self.queued or self.done.touch(entry_id)
+
+    def poll(self):
+        """
+        Requests each of the feeds whose pause has elapsed concurrently,
+        waiting for each of them up to its timeout, and returns each
+        feed's URL and parsed feed, in the order the feeds are given.
+        The timeout is also the socket timeout for each request, so
+        that a feed that doesn't respond in time is dropped, and
+        requested again once its pause has elapsed. The ETag and
+        Last-Modified headers from each feed's previous response are
+        sent, so that nothing is returned if the feed hasn't changed.
+        If the stream_run option is set, feeds are parsed with
+        babbler.stream instead of feedparser. Only the state of feed
+        requests is changed, so this can be called while entries are
+        being queued and posted.
+        """
+        from multiprocessing import TimeoutError
+        from babbler.stream import TimeoutHandler
+        now = time()
+        if self.stream_run:
+            from babbler.stream import parse
+            kwargs = {"seen": lambda i: i in self.queued or i in self.done,
+                      "run": self.stream_run}
+        else:
+            from feedparser import parse
+            kwargs = {}
+        pending = []
+        for url, pause, timeout in self.feeds:
+            if self.polled.get(url, 0) + pause <= now:
+                self.polled[url] = now
+                args = (parse, url) + self.validators.get(url, (None, None))
+                handlers = [TimeoutHandler(timeout)]
+                result = self.pool.apply_async(fetch, args,
+                                               dict(kwargs, handlers=handlers))
+                pending.append((url, now + timeout, result))
+        polled = []
+        for url, deadline, result in pending:
+            try:
+                feed = result.get(max(deadline - time(), 0))
+            except TimeoutError:
+                logging.error("Feed timed out: %s" % url)
+            except Exception, e:
+                logging.error("Feed error for %s: %s" % (url, e))
+            else:
+                polled.append((url, feed))
+        return polled
 
-    def entries(self):
+    def entries(self, polled=None):
         """
-        Loads the RSS feed in reverse order and return new entries.
+        Returns the new entries from the feeds, as returned by poll(),
+        which is called if they aren't given. The new entries from each
+        feed are merged by taking one entry from each feed in turn,
+        dropping entries whose titles are near duplicates of queued
+        titles, or of earlier entries. Titles are added to the feed's
+        index when the entries are queued.
         """
+        if polled is None:
+            polled = self.poll()
+        new = [self.feed_entries(url, feed) for url, feed in polled]
         entries = []
-        feed = parse(self.feed_url)
+        ids = set()
+        earlier = TitleIndex(self.titles.size, self.titles.similarity)
+        for group in izip_longest(*new):
+            for entry in group:
+                if entry is None or entry["id"] in ids:
+                    continue
+                ids.add(entry["id"])
+                matched = self.titles.match(entry["title"])
+                if matched is None:
+                    matched = earlier.match(entry["title"])
+                if matched is not None:
+                    logging.info("Duplicate entry '%s' matches '%s'" %
+                                 (entry["title"], matched))
+                    self.discard(entry["id"])
+                else:
+                    earlier.add(entry["title"])
+                    entries.append(entry)
+        return entries
+
+    def feed_entries(self, url, feed):
+        """
+        Returns the new entries from a parsed feed in reverse order,
+        storing the feed's ETag and Last-Modified headers.
+        """
+        entries = []
+        if feed.get("status") == 304:
+            logging.debug("Feed not modified: %s" % url)
+            return entries
+        validators = (feed.get("etag"), feed.get("modified"))
+        if validators != self.validators.get(url, (None, None)):
+            self.validators[url] = validators
+            self.journal.append(("validators", (url, validators)))
         try:
             error = str(feed["bozo_exception"]).strip()
         except KeyError:
             pass
         else:
-            logging.error("Feed error: %s" % error)
-        saved = self.saved()
-        for entry in reversed(feed.entries):
-            if entry["id"] not in saved:
+            logging.error("Feed error for %s: %s" % (url, error))
+        for entry in reversed(feed["entries"]):
+            if not self.seen(entry["id"]):
                 # Ignore entries that match any ignore string, are too
                 # long, or are already in "todo" or "done".
-                ignored = []
-                if self.ignore:
-                    ignored = [s for s in self.ignore.split(",")
-                               if s and s.lower() in entry["title"].lower()]
+                ignored = self.ignored(entry["title"])
                 if ignored:
                     logging.debug("Ignore strings (%s) found in: %s" %
                                   (", ".join(ignored), entry["title"]))
-                    self.done.add(entry["id"])
+                    self.discard(entry["id"])
                 elif len(entry["title"]) > self.max_len:
                     logging.debug("Entry too long: %s" % entry["title"])
-                    self.done.add(entry["id"])
+                    self.discard(entry["id"])
                 else:
                     entry = {"id": entry["id"], "title": entry["title"]}
                     entries.append(entry)
         return entries
 
-    def __iter__(self):
-        """
-        Moves any new entries onto the "todo" queue and yields the first
-        entry in the "todo" queue. Regardless of new entries, pause on
-        each iteration, taking the queue_slice setting into account.
-        """
-        last_feed_time = 0
-        while True:
-            # Get new entries and save the data file if new entries found
-            # if the pause period has elapsed.
-            if ((last_feed_time + self.pause) - time()) <= 0:
-                last_feed_time = time()
-                entries = self.entries()
-                logging.debug("New queued entries: %s" % len(entries))
-                if entries:
-                    self.todo.extend(entries)
-                # Update the time to sleep - use the pause option unless
-                # there are items in the "todo" queue, otherwise set the
-                # pause to consume the portion of the queue size defined
-                # by the queue_slice option before the next feed request.
-                pause = self.pause
-                if len(self.todo) > self.queue_slice * 10:
-                    queue_slice = ceil(len(self.todo) * self.queue_slice)
-                    pause = int(pause / queue_slice)
-            # Yield the first entry in the "todo" list.
-            if self.todo:
-                logging.debug("Total queued entries: %s" % len(self.todo))
-                yield self.todo[0]
-            logging.debug("Pausing for %s seconds" % pause)
-            sleep(pause)
-
-    def process(self):
-        """
-        Move the first entry in the "todo" queue to the "done" set.
-        """
-        self.done.add(self.todo.pop(0)["id"])
+    def delay(self):
+        """
+        Returns the seconds to wait between posting feed entries. This
+        is the pause option unless there are enough entries queued,
+        otherwise it's set to post the portion of the queue defined by
+        the queue_slice option before the next feed request.
+        """
+        pause = self.pause
+        if len(self.todo) > self.queue_slice * 10:
+            queue_slice = ceil(len(self.todo) * self.queue_slice)
+            pause = int(pause / queue_slice)
+        return pause
+
+    def stats(self):
+        """
+        Returns the number of queued replies and feed entries, the
+        seconds between posting feed entries, and the estimated seconds
+        until all queued entries are posted.
+        """
+        delay = self.delay()
+        return {"replies": len(self.replies), "todo": len(self.todo),
+                "delay": delay, "drain_time": len(self.todo) * delay}
+
+    def head(self):
+        """
+        Returns the next entry to post, replies first, or None if
+        nothing is queued.
+        """
+        for queue in (self.replies, self.todo):
+            if queue:
+                return queue[0]
+        return None
+
+    def queue(self, entries):
+        """
+        Add new entries to the "todo" queue, or to the "replies" queue
+        for replies.
+        """
+        for entry in entries:
+            self.enqueue(entry)
+        self.journal.append(("queue", entries))
+
+    def enqueue(self, entry):
+        if "to" in entry:
+            self.replies.append(entry)
+        else:
+            self.todo.append(entry)
+            self.titles.add(entry["title"])
+        self.queued[entry["id"]] = entry
+
+    def composed(self, composed):
+        """
+        Stores the tweet, time composed and hashtags waiting to be
+        searched for each queued entry, given as returned by
+        Composer.composed().
+        """
+        composed = [c for c in composed if c[0] in self.queued]
+        for entry_id, tweet, composed_time, wanted in composed:
+            self.queued[entry_id].update(tweet=tweet, composed=composed_time,
+                                         wanted=wanted)
+        if composed:
+            self.journal.append(("composed", composed))
+
+    def discard(self, entry_id):
+        """
+        Add an entry ID that won't be posted to the "done" set.
+        """
+        self.done.add(entry_id)
+        self.journal.append(("done", [entry_id]))
+
+    def process(self, entry=None):
+        """
+        Move the given entry, or the entry returned by head(), to the
+        "done" set.
+        """
+        if entry is None:
+            entry = self.head()
+        self.dequeue(entry)
+        self.done.add(entry["id"])
+        self.journal.append(("done", [entry["id"]]))
+
+    def dequeue(self, entry):
+        del self.queued[entry["id"]]
+        queue = self.replies if "to" in entry else self.todo
+        if queue[0] is entry:
+            queue.popleft()
+        else:
+            queue.remove(entry)
+
+    def changes(self):
+        """
+        Returns and clears the changes made to the queues and the
+        "done" set, for journaling by PersistentDict.
+        """
+        changes, self.journal = self.journal, []
+        return changes
+
+    def apply(self, changes):
+        """
+        Replays journaled changes. Changes may already be reflected in
+        the feed if they were journaled before the last compaction, so
+        entries already saved are skipped.
+        """
+        for action, items in changes:
+            if action == "queue":
+                for entry in items:
+                    if not self.seen(entry["id"]):
+                        self.enqueue(entry)
+            elif action == "done":
+                for entry_id in items:
+                    self.done.add(entry_id)
+                    entry = self.queued.get(entry_id)
+                    if entry is not None:
+                        self.dequeue(entry)
+            elif action == "composed":
+                for entry_id, tweet, composed_time, wanted in items:
+                    entry = self.queued.get(entry_id)
+                    if entry is not None:
+                        entry.update(tweet=tweet, composed=composed_time,
+                                     wanted=wanted)
+            elif action == "validators":
+                url, validators = items
+                self.validators[url] = validators
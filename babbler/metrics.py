@@ -0,0 +1,143 @@
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from contextlib import contextmanager
+from threading import Lock, Thread
+from time import time
+
+
+# Upper bounds of histogram buckets for timings in seconds.
+SECONDS = (.01, .05, .1, .25, .5, 1, 2.5, 5, 10, 30, 60)
+
+
+def format_labels(labels, **extra):
+    """
+    Formats a tuple of label name/value pairs for the Prometheus text
+    format.
+    """
+    labels = list(labels) + sorted(extra.items())
+    if not labels:
+        return ""
+    escape = lambda v: (unicode(v).replace("\\", "\\\\").replace("\n", "\\n")
+                        .replace('"', '\\"'))
+    return "{%s}" % ",".join(['%s="%s"' % (k, escape(v)) for k, v in labels])
+
+
+class Metrics(object):
+    """
+    Counters, gauges and histograms, each keyed by name and labels,
+    rendered in the Prometheus text format. Functions can be added
+    with collect() to set gauges each time the metrics are rendered.
+    """
+
+    def __init__(self):
+        self.lock = Lock()
+        self.types = {}
+        self.values = {}
+        self.histograms = {}
+        self.collectors = []
+
+    def key(self, name, kind, labels):
+        self.types.setdefault(name, kind)
+        return name, tuple(sorted(labels.items()))
+
+    def inc(self, name, value=1, **labels):
+        with self.lock:
+            key = self.key(name, "counter", labels)
+            self.values[key] = self.values.get(key, 0) + value
+
+    def set(self, name, value, **labels):
+        with self.lock:
+            self.values[self.key(name, "gauge", labels)] = value
+
+    def observe(self, name, value, buckets=SECONDS, **labels):
+        """
+        Adds a value to a histogram, which is stored as the count of
+        values in each bucket, the sum and the total count.
+        """
+        with self.lock:
+            key = self.key(name, "histogram", labels)
+            if key not in self.histograms:
+                self.histograms[key] = (buckets, [0] * len(buckets), [0, 0])
+            buckets, counts, totals = self.histograms[key]
+            for i, bound in enumerate(buckets):
+                if value <= bound:
+                    counts[i] += 1
+            totals[0] += value
+            totals[1] += 1
+
+    @contextmanager
+    def timer(self, name, **labels):
+        """
+        Records the seconds taken by the block in a histogram, and
+        counts errors raised in a counter named after the histogram.
+        """
+        start = time()
+        try:
+            yield
+        except Exception:
+            self.inc(name.replace("_seconds", "_errors_total"), **labels)
+            raise
+        finally:
+            self.observe(name, time() - start, **labels)
+
+    def collect(self, func):
+        """
+        Adds a function that sets gauges when metrics are rendered.
+        """
+        self.collectors.append(func)
+
+    def render(self):
+        """
+        Returns all metrics in the Prometheus text format.
+        """
+        for func in self.collectors:
+            func(self)
+        lines = []
+        line = lambda name, labels, value, **extra: lines.append(
+            "%s%s %s" % (name, format_labels(labels, **extra), value))
+        with self.lock:
+            for name, kind in sorted(self.types.items()):
+                lines.append("# TYPE %s %s" % (name, kind))
+                for (key, labels), value in sorted(self.values.items()):
+                    if key == name:
+                        line(name, labels, value)
+                for (key, labels), histogram in sorted(
+                        self.histograms.items()):
+                    if key != name:
+                        continue
+                    buckets, counts, (total, count) = histogram
+                    for bound, bucket_count in zip(buckets, counts):
+                        line(name + "_bucket", labels, bucket_count, le=bound)
+                    line(name + "_bucket", labels, count, le="+Inf")
+                    line(name + "_sum", labels, total)
+                    line(name + "_count", labels, count)
+        return "\n".join(lines) + "\n"
+
+    def serve(self, port, host="127.0.0.1"):
+        """
+        Serves the rendered metrics over HTTP in a background thread.
+        """
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+
+            def do_GET(self):
+                body = metrics.render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type",
+                                 "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        server = HTTPServer((host, port), Handler)
+        thread = Thread(target=server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        return server
+
+
+# Shared metrics for all of babbler's modules.
+metrics = Metrics()
@@ -0,0 +1,84 @@
+import logging
+from signal import signal, SIGTERM
+
+from babbler.bot import Bot
+from babbler.scheduler import Scheduler
+
+
+# Default number of threads that run the tasks of all bots.
+WORKERS = 8
+
+
+class MultiBot(object):
+    """
+    Runs a bot for each of several accounts in one process. Each bot
+    has its own directory containing its data file, which must first
+    be set up by running babbler in it. The dictionary, stopwords and
+    Eliza grammar are loaded once and shared by all bots, and each
+    bot's tasks are run by a shared pool of threads. Logging, the PID
+    file, and the log level, metrics and profile options are taken
+    from the first bot. Stages are timed if timing is True.
+    """
+
+    def __init__(self, paths, workers=WORKERS, timing=False, **kwargs):
+        self.bots = [Bot(path=path, **kwargs) for path in paths]
+        self.workers = workers
+        self.timing = timing
+
+    def run(self, as_daemon=False):
+        """
+        Loads and sets up each bot, and runs their tasks until an
+        unhandled error occurs or SIGTERM is received, then saves each
+        bot's data once running tasks have finished.
+        """
+        from multiprocessing.pool import ThreadPool
+        for bot in self.bots:
+            bot.load(args=[])
+        self.bots[0].data["options"]["timing"] = self.timing
+        self.bots[0].start_process(as_daemon)
+        scheduler = Scheduler(pool=ThreadPool(self.workers))
+        for i, bot in enumerate(self.bots):
+            bot.setup()
+            bot.schedule(scheduler, prefix="%s:%s:" % (i, bot.path))
+        signal(SIGTERM, self.terminate)
+        try:
+            scheduler.run()
+        except Exception, e:
+            logging.critical("Shutting down on unhandled error: %s" % e)
+        running = scheduler.join()
+        if running:
+            logging.error("Stopping with tasks running: %s" %
+                          ", ".join(running))
+        for bot in self.bots:
+            bot.flush()
+
+    def terminate(self, *args):
+        """
+        Stops the scheduler and each bot's tasks on SIGTERM.
+        """
+        for bot in self.bots:
+            bot.terminate()
+
+
+def main(args, **kwargs):
+    """
+    Entry point for running multiple bots, given the directories of
+    each bot.
+    """
+    from optparse import OptionParser
+    parser = OptionParser(usage="usage: %prog --multi [options] dirs")
+    parser.add_option("-d", "--daemonize", action="store_true",
+                      default=False, help="Run as a background process")
+    parser.add_option("-w", "--workers", type="int", default=WORKERS,
+                      metavar="threads", help="Number of threads for "
+                      "running the bots' tasks (default:%default)")
+    parser.add_option("-I", "--timing", action="store_true", default=False,
+                      help="Log the time taken by each stage of the bots' "
+                      "tasks")
+    options, paths = parser.parse_args(args)
+    if not paths:
+        parser.error("No bot directories given")
+    MultiBot(paths, workers=options.workers, timing=options.timing,
+             **kwargs).run(options.daemonize)
+    if options.daemonize:
+        print "Daemon started"
@@ -1,8 +1,6 @@
 
 from optparse import OptionGroup, OptionParser
 
-from yaml import load
-
 
 class Options(dict):
     """
@@ -16,11 +14,12 @@ class Options(dict):
         Set up args and OptionParser.
         """
         # Load YAML file and create OptionParser.
+        from yaml import load
         with open(yaml_path) as f:
             data = load(f)
         kwargs["usage"] = "usage: %prog [options]"
         kwargs["epilog"] = data["epilog"]
-        existing = kwargs.pop("existing")
+        existing = kwargs.pop("existing", {})
         self.parser = OptionParser(**kwargs)
 
         # Set Options specific attributes.
@@ -44,6 +43,13 @@ class Options(dict):
                     option["help"] %= formatting
                     group.add_option(*option.pop("args"), **option)
                 self.parser.add_option_group(group)
+        self.update_defaults(existing)
+
+    def update_defaults(self, existing):
+        """
+        Use the existing options persisted in the data file as the
+        defaults.
+        """
         self.defaults.update(existing)
 
     def append(self, option, value):
@@ -77,12 +83,14 @@ class Options(dict):
         """
         return [o for g in self.parser.option_groups for o in g.option_list]
 
-    def parse_args(self):
+    def parse_args(self, args=None, prompt=True):
         """
         Call OptionParser's parse_args() and handle defaults, append,
-        subtract and prompting for missing options.
+        subtract and prompting for missing options. Args are read from
+        the command line unless given. Missing options are left as None
+        if prompt is False.
         """
-        parsed, _ = self.parser.parse_args()
+        parsed, _ = self.parser.parse_args(args)
         final = {}
         append = getattr(parsed, self.append_option)
         subtract = getattr(parsed, self.subtract_option)
@@ -97,7 +105,7 @@ class Options(dict):
                     value = self.subtract(option, value)
                 if value is None:
                     value = default
-                if value is None:
+                if value is None and prompt:
                     value = raw_input("Please enter '%s': " % option.help)
                 self[name] = value
         return self
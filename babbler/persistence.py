@@ -1,36 +1,144 @@
-
-from cPickle import dump, load
-from os import remove
+from cPickle import dump, dumps, load, HIGHEST_PROTOCOL, UnpicklingError
+import logging
+from os import fsync, remove, rename
 
 
 class PersistentDict(dict):
     """
-    Dictionary that persists itself to a pickle file.
+    Dictionary that persists itself to a pickle file. Rather than
+    pickling everything on each save, changes are appended to a
+    journal file, which is periodically compacted into the pickle
+    file. Values that record their own changes can implement the
+    methods ``changes()``, which returns and clears a list of changes
+    made since it was last called, and ``apply(changes)``, which
+    replays them. Other values are journaled in full when they change.
     """
 
-    def __init__(self, path):
+    def __init__(self, path, compact_every=1000):
         self.path = path
+        self.journal_path = path + ".journal"
+        self.compact_every = compact_every
+        self.records = 0
+        self.written = {}
 
     def load(self):
         """
-        Load self from file.
+        Load self from file, replaying the journal if any. Pickle files
+        saved prior to journaling are loaded as is.
         """
+        loaded = False
         try:
             with open(self.path, "rb") as f:
                 self.update(load(f))
-                return True
+                loaded = True
+        except IOError:
+            pass
+        try:
+            with open(self.journal_path, "r+b") as f:
+                loaded = True
+                while True:
+                    offset = f.tell()
+                    try:
+                        record = load(f)
+                    except EOFError:
+                        break
+                    except (UnpicklingError, ValueError, TypeError), e:
+                        logging.error("Journal truncated: %s" % e)
+                        break
+                    self.replay(record)
+                    self.records += 1
+                # Remove any incomplete record from an interrupted
+                # write, so that records saved after it can be loaded.
+                f.seek(0, 2)
+                if f.tell() > offset:
+                    logging.error("Discarding incomplete journal record "
+                                  "at byte %s" % offset)
+                    f.truncate(offset)
         except IOError:
-            return False
+            pass
+        self.mark()
+        return loaded
+
+    def replay(self, record):
+        """
+        Apply a single journal record.
+        """
+        action, key = record[:2]
+        if action == "set":
+            self[key] = record[2]
+        elif action == "del":
+            self.pop(key, None)
+        elif action == "apply" and key in self:
+            self[key].apply(record[2])
+
+    def mark(self):
+        """
+        Store the state of each value as it's been written, so that
+        subsequent saves only journal what has changed.
+        """
+        self.written = {}
+        for key, value in self.items():
+            if hasattr(value, "changes"):
+                value.changes()
+                self.written[key] = id(value)
+            else:
+                self.written[key] = dumps(value, HIGHEST_PROTOCOL)
 
     def save(self):
         """
-        Save self to file.
+        Append the changes made since the last save to the journal,
+        compacting it once it reaches the number of records given.
+        """
+        if self.records >= self.compact_every:
+            self.compact()
+            return
+        records = []
+        for key in set(self.written) - set(self):
+            records.append(("del", key))
+            del self.written[key]
+        for key, value in self.items():
+            written = self.written.get(key)
+            if hasattr(value, "changes") and written == id(value):
+                changes = value.changes()
+                if changes:
+                    records.append(("apply", key, changes))
+            elif hasattr(value, "changes"):
+                value.changes()
+                records.append(("set", key, value))
+                self.written[key] = id(value)
+            else:
+                pickled = dumps(value, HIGHEST_PROTOCOL)
+                if pickled != written:
+                    records.append(("set", key, value))
+                    self.written[key] = pickled
+        if records:
+            with open(self.journal_path, "ab") as f:
+                for record in records:
+                    dump(record, f, HIGHEST_PROTOCOL)
+            self.records += len(records)
+
+    def compact(self):
+        """
+        Save self to file and clear the journal. The file is written
+        to a temporary path and renamed, so that an interrupted write
+        leaves the previous file intact.
         """
-        with open(self.path, "wb") as f:
-            dump(self, f)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            dump(dict(self), f, HIGHEST_PROTOCOL)
+            f.flush()
+            fsync(f.fileno())
+        rename(tmp_path, self.path)
+        open(self.journal_path, "wb").close()
+        self.records = 0
+        self.mark()
 
     def remove(self):
         """
         Remove file.
         """
+        try:
+            remove(self.journal_path)
+        except OSError:
+            pass
         remove(self.path)
@@ -0,0 +1,203 @@
+from threading import Lock
+from time import time
+
+
+class PopularityIndex(object):
+    """
+    Time-decayed counts of how often each hashtag has been seen in
+    tweets, keyed by the case-folded tag, so that hashtags can be
+    scored from memory. Each count halves over the half-life. Tags
+    that are scored before they've been seen are marked as wanted, so
+    that they can be searched for, and the time each tag was last
+    searched for is stored, so that searches can be refreshed after
+    the TTL. Once the maximum size is reached, the least popular tags
+    are evicted.
+    """
+
+    def __init__(self, half_life=86400, ttl=86400, size=5000):
+        self.half_life = half_life
+        self.ttl = ttl
+        self.size = size
+        # Each tag maps to its count, the time the count was last
+        # updated, and the time the tag was last searched for, which
+        # is 0 for wanted tags and None for tags never searched for.
+        self.tags = {}
+        self.since_id = None
+        self.lock = Lock()
+        self.journal = []
+
+    def setup(self, half_life, ttl, size):
+        """
+        Set up options, evicting tags if the size has been reduced.
+        """
+        self.half_life = half_life
+        self.ttl = ttl
+        self.size = size
+        with self.lock:
+            self.evict()
+
+    def __getstate__(self):
+        """
+        Lock can't be pickled, so remove it, along with the journal
+        of changes. The tags are copied while the lock is held, since
+        they can be changed by other threads while being pickled.
+        """
+        state = dict(self.__dict__)
+        del state["lock"]
+        state.pop("journal", None)
+        with self.lock:
+            state["tags"] = dict(self.tags)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = Lock()
+        self.journal = []
+
+    def __len__(self):
+        return len(self.tags)
+
+    def decay(self, seconds):
+        return 0.5 ** (seconds / float(self.half_life))
+
+    def score(self, tag, now=None):
+        """
+        Returns the tag's count decayed to now, or None if the tag
+        hasn't been seen or searched for.
+        """
+        with self.lock:
+            try:
+                count, updated, _ = self.tags[tag.lower()]
+            except KeyError:
+                return None
+        now = time() if now is None else now
+        return count * self.decay(max(now - updated, 0))
+
+    def seen(self, seen):
+        """
+        Adds a list of tag/time pairs for hashtags seen in tweets.
+        """
+        with self.lock:
+            self.replay([("seen", seen)])
+            self.journal.append(("seen", seen))
+            self.evict()
+
+    def searched(self, tag, when=None):
+        """
+        Stores the time the tag was searched for.
+        """
+        with self.lock:
+            change = ("searched", (tag.lower(), when or time()))
+            self.replay([change])
+            self.journal.append(change)
+
+    def want(self, tag):
+        """
+        Marks a tag that hasn't been seen to be searched for.
+        """
+        with self.lock:
+            if tag.lower() not in self.tags:
+                change = ("searched", (tag.lower(), 0))
+                self.replay([change])
+                self.journal.append(change)
+
+    def wanted(self, tags):
+        """
+        Returns the tags that are marked to be searched for and
+        haven't been yet.
+        """
+        with self.lock:
+            return [tag for tag in tags
+                    if self.tags.get(tag.lower(), (0, 0, None))[2] == 0]
+
+    def statuses(self, statuses):
+        """
+        Adds the hashtags in each of the statuses, returning the ID of
+        the newest status.
+        """
+        seen = [(h.text, s.created_at_in_seconds)
+                for s in statuses for h in s.hashtags or []]
+        if seen:
+            self.seen(seen)
+        if statuses:
+            return max([s.id for s in statuses])
+
+    def stale(self, limit, now=None):
+        """
+        Returns up to the limit of tags to search for - wanted tags
+        first, then the most popular tags searched for longer ago than
+        the TTL.
+        """
+        now = time() if now is None else now
+        with self.lock:
+            wanted = [tag for tag, (_, _, searched) in self.tags.items()
+                      if searched == 0]
+            expired = [(count * self.decay(max(now - updated, 0)), tag)
+                       for tag, (count, updated, searched) in self.tags.items()
+                       if searched and searched + self.ttl < now]
+        expired = [tag for _, tag in sorted(expired, reverse=True)]
+        return (wanted + expired)[:limit]
+
+    def set_since_id(self, since_id):
+        """
+        Stores the ID of the newest tweet read from the timeline.
+        """
+        with self.lock:
+            self.since_id = since_id
+            self.journal.append(("since_id", since_id))
+
+    def evict(self):
+        """
+        Remove the least popular tags once the maximum size is reached,
+        down to 90% of the size so that evicting isn't done each time
+        a tag is added. The lock must be held.
+        """
+        if len(self.tags) <= self.size:
+            return
+        now = time()
+        scores = sorted([(c * self.decay(max(now - u, 0)), t)
+                         for t, (c, u, _) in self.tags.items()])
+        evicted = [t for _, t in scores[:len(self.tags) - self.size * 9 / 10]]
+        self.replay([("evict", evicted)])
+        self.journal.append(("evict", evicted))
+
+    def replay(self, changes):
+        """
+        Applies changes without journaling them. The lock must be held.
+        """
+        for action, items in changes:
+            if action == "seen":
+                for tag, when in items:
+                    count, updated, searched = self.tags.get(tag.lower(),
+                                                             (0, 0, None))
+                    if when >= updated:
+                        count = count * self.decay(when - updated) + 1
+                        updated = when
+                    else:
+                        count += self.decay(updated - when)
+                    self.tags[tag.lower()] = (count, updated, searched)
+            elif action == "searched":
+                tag, when = items
+                count, updated, _ = self.tags.get(tag, (0, 0, None))
+                self.tags[tag] = (count, updated, when)
+            elif action == "evict":
+                for tag in items:
+                    self.tags.pop(tag, None)
+            elif action == "since_id":
+                self.since_id = items
+
+    def changes(self):
+        """
+        Returns and clears the changes made, for journaling by
+        PersistentDict.
+        """
+        with self.lock:
+            changes, self.journal = self.journal, []
+        return changes
+
+    def apply(self, changes):
+        """
+        Replays journaled changes.
+        """
+        with self.lock:
+            self.replay(changes)
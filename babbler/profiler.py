@@ -0,0 +1,114 @@
+from contextlib import contextmanager
+import logging
+from threading import Lock
+from time import time
+
+from babbler.metrics import metrics
+
+
+class Profiler(object):
+    """
+    Times each stage of the main loop's iterations, and captures
+    cProfile stats for iterations, which are separately enabled, so
+    that stages can be timed without the overhead of profiling.
+    Stages run in other threads, such as composing tweets, are timed
+    in the current iteration. When tasks run in a pool of threads,
+    the next task run is profiled in the thread running it, rather
+    than the iteration, which only starts tasks.
+    """
+
+    def __init__(self):
+        self.lock = Lock()
+        self.timing = False
+        self.remaining = 0
+        self.path = None
+        self.iterations = 0
+        self.profiled = 0
+        self.times = {}
+
+    def setup(self, timing, iterations, path):
+        """
+        Enables timing of stages if timing is True, and profiles the
+        given number of iterations, with stats written to path
+        formatted with the number of the profile. Each SIGUSR1
+        received profiles another iteration.
+        """
+        from signal import signal, SIGUSR1
+        self.timing = timing
+        self.remaining = iterations
+        self.path = path
+        signal(SIGUSR1, self.signalled)
+
+    def signalled(self, signum, frame):
+        with self.lock:
+            self.remaining += 1
+
+    @contextmanager
+    def profile(self, name):
+        """
+        Profiles the block in the current thread if profiles remain,
+        and writes the stats.
+        """
+        with self.lock:
+            profiling = self.remaining > 0
+            if profiling:
+                self.remaining -= 1
+                self.profiled += 1
+                path = self.path % self.profiled
+        if not profiling:
+            yield
+            return
+        from cProfile import Profile
+        profile = Profile()
+        profile.enable()
+        try:
+            yield
+        finally:
+            profile.disable()
+            profile.dump_stats(path)
+            logging.info("Profile of %s written to %s" % (name, path))
+
+    @contextmanager
+    def stage(self, name):
+        """
+        Adds the seconds taken by the block to the stage's time in the
+        current iteration.
+        """
+        if not self.timing:
+            yield
+            return
+        start = time()
+        try:
+            yield
+        finally:
+            seconds = time() - start
+            metrics.observe("babbler_stage_seconds", seconds, stage=name)
+            with self.lock:
+                self.times[name] = self.times.get(name, 0) + seconds
+
+    @contextmanager
+    def iteration(self, profile=True):
+        """
+        Logs the time taken by each stage during the block, and
+        profiles it unless profile is False, for when tasks are
+        profiled in the threads running them.
+        """
+        self.iterations += 1
+        name = "iteration %s" % self.iterations
+        try:
+            if profile:
+                with self.profile(name):
+                    yield
+            else:
+                yield
+        finally:
+            with self.lock:
+                times, self.times = self.times, {}
+            if times:
+                stages = ["%s %.3fs" % t for t in sorted(times.items())]
+                logging.info("Iteration %s stages: %s" %
+                             (self.iterations, ", ".join(stages)))
+
+
+# Shared profiler for the main loop's stages.
+profiler = Profiler()
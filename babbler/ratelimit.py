@@ -0,0 +1,173 @@
+import logging
+from threading import Event, Lock
+from time import time
+
+from babbler.metrics import metrics
+
+
+API_URL = "https://api.twitter.com/1.1/%s.json"
+
+# Priority, request limit, window in seconds, and URL path for each of
+# the Twitter API methods used. Requests with priority 0 wait for the
+# rate limit to allow them, while others fail immediately.
+ENDPOINTS = {
+    "PostUpdate": (0, 300, 3 * 60 * 60, "statuses/update"),
+    "GetUserTimeline": (0, 900, 15 * 60, "statuses/user_timeline"),
+    "DestroyStatus": (0, 900, 15 * 60, "statuses/destroy/:id"),
+    "GetMentions": (1, 75, 15 * 60, "statuses/mentions_timeline"),
+    "GetSearch": (2, 180, 15 * 60, "search/tweets"),
+    "GetHomeTimeline": (2, 15, 15 * 60, "statuses/home_timeline"),
+}
+
+# Initial and maximum seconds to back off for after a request is rate
+# limited, when the reset time isn't known.
+BACKOFF = 60
+MAX_BACKOFF = 15 * 60
+
+
+class RateLimited(Exception):
+    pass
+
+
+class TokenBucket(object):
+    """
+    Token bucket that allows the given number of requests per window,
+    which can be blocked until a given time when rate limited.
+    """
+
+    def __init__(self, limit, window, now):
+        self.limit = limit
+        self.window = window
+        self.tokens = float(limit)
+        self.updated = now
+        self.blocked_until = 0
+        self.backoff = 0
+
+    def refill(self, now):
+        refilled = (now - self.updated) * float(self.limit) / self.window
+        self.tokens = min(self.limit, self.tokens + refilled)
+        self.updated = now
+
+    def wait(self, now):
+        """
+        Returns the seconds until a request is allowed.
+        """
+        self.refill(now)
+        if self.blocked_until > now:
+            return self.blocked_until - now
+        if self.tokens >= 1:
+            return 0
+        return (1 - self.tokens) * self.window / self.limit
+
+    def take(self, now):
+        self.refill(now)
+        self.tokens -= 1
+
+    def sync(self, limit, remaining, reset, now):
+        """
+        Update the bucket from the rate limit headers of a response.
+        """
+        self.refill(now)
+        self.limit = limit
+        self.tokens = min(self.tokens, remaining)
+        if remaining <= 0:
+            self.blocked_until = max(self.blocked_until, reset)
+
+    def limited(self, now):
+        """
+        Block the bucket after a rate limit error, doubling the back off
+        each time until a request succeeds.
+        """
+        self.backoff = min(max(self.backoff * 2, BACKOFF), MAX_BACKOFF)
+        self.tokens = 0
+        self.blocked_until = max(self.blocked_until, now + self.backoff)
+
+    def succeeded(self):
+        self.backoff = 0
+
+
+def is_rate_limit_error(error):
+    """
+    Returns True if the error is Twitter's rate limit error.
+    """
+    message = str(error).lower()
+    return "rate limit" in message or "'code': 88" in message
+
+
+class RateLimitedApi(object):
+    """
+    Wraps the Twitter API object, keeping each of the methods listed in
+    ENDPOINTS within their rate limits. Waiting for a rate limit is cut
+    short once the stopped event is set, so that the process can stop
+    without waiting for it. A sleep function can be given instead, so
+    that rate limits can be waited for without waiting.
+    """
+
+    def __init__(self, api, clock=time, sleep=None, stopped=None):
+        self.api = api
+        self.clock = clock
+        self.sleep = sleep
+        self.stopped = stopped or Event()
+        self.lock = Lock()
+        now = clock()
+        self.buckets = dict([(name, TokenBucket(limit, window, now))
+                             for name, (_, limit, window, _)
+                             in ENDPOINTS.items()])
+
+    def __getattr__(self, name):
+        method = getattr(self.api, name)
+        if name not in ENDPOINTS:
+            return method
+        return lambda *args, **kwargs: self.call(name, method, args, kwargs)
+
+    def call(self, name, method, args, kwargs):
+        """
+        Calls the API method once its rate limit allows it, waiting
+        for requests with priority 0 and raising RateLimited for
+        others, or for any once stopped.
+        """
+        priority = ENDPOINTS[name][0]
+        bucket = self.buckets[name]
+        while True:
+            with self.lock:
+                wait = bucket.wait(self.clock())
+                if wait <= 0:
+                    bucket.take(self.clock())
+                    break
+            if priority > 0 or self.stopped.is_set():
+                metrics.inc("babbler_api_rate_limited_total", method=name)
+                raise RateLimited("%s rate limited for %.0f seconds" %
+                                  (name, wait))
+            logging.info("%s rate limited, waiting %.0f seconds" %
+                         (name, wait))
+            if self.sleep is None:
+                self.stopped.wait(wait)
+            else:
+                self.sleep(wait)
+        try:
+            with metrics.timer("babbler_api_request_seconds", method=name):
+                result = method(*args, **kwargs)
+        except Exception, e:
+            if is_rate_limit_error(e):
+                with self.lock:
+                    bucket.limited(self.clock())
+            raise
+        with self.lock:
+            bucket.succeeded()
+            self.sync(name)
+        return result
+
+    def sync(self, name):
+        """
+        Update the bucket from the rate limit headers of the last
+        response, if the API object has stored them.
+        """
+        url = API_URL % ENDPOINTS[name][3]
+        try:
+            limit = self.api.rate_limit.get_limit(url)
+            limit, remaining, reset = map(int, limit)
+        except Exception:
+            return
+        # Unknown endpoints return a default with no reset time.
+        if limit > 0 and reset > 0:
+            self.buckets[name].sync(limit, remaining, reset, self.clock())
@@ -1,59 +1,144 @@
 
 import logging
-from random import choice
-import re
-from string import punctuation
-
-from yaml import load
 
+from babbler import eliza
 from babbler.feed import Feed
 
 
+# Number of mentions to request per page, and the maximum number of
+# pages to request on each poll.
+MENTIONS_PER_PAGE = 200
+MENTIONS_MAX_PAGES = 4
+
+
 class RespondingFeed(Feed):
     """
-    Extends Feed to also check for replies on Twitter, adding
+    Extends Feed to also check for replies on Twitter, queuing
     replies generated from Eliza responses as entries to tweet.
     """
 
+    def __init__(self):
+        super(RespondingFeed, self).__init__()
+        # The newest mention read up to, the ID to continue requesting
+        # older mentions from if more were found than could be read in
+        # one poll, and the newest mention found since then.
+        self.since_id = None
+        self.max_id = None
+        self.newest_id = None
+
+    def __setstate__(self, state):
+        super(RespondingFeed, self).__setstate__(state)
+        self.__dict__.setdefault("since_id", None)
+        self.__dict__.setdefault("max_id", None)
+        self.__dict__.setdefault("newest_id", None)
+
     def setup(self, options):
         """
-        Store the Twitter API reference, load the Eliza grammar and
+        Store the Twitter API reference and the popularity index that
+        hashtags in mentions are added to, load the Eliza grammar and
         set up the feed's options.
         """
         self.twitter = options.pop("twitter")
-        with open(options.pop("eliza_path")) as f:
-            grammar = load(f)
-            self.reflections = grammar["reflections"]
-            self.patterns = [(re.compile(item.keys()[0], re.IGNORECASE),
-                             item.values()[0]) for item in grammar["patterns"]]
+        self.popularity = options.pop("popularity", None)
+        self.eliza = eliza.load(options.pop("eliza_path"))
         super(RespondingFeed, self).setup(options)
 
     def __getstate__(self):
         """
-        Twitter object can't be pickled, so remove it.
+        Twitter object can't be pickled, so remove it, along with the
+        Eliza grammar which is loaded on setup, and the popularity
+        index which is persisted separately.
         """
-        state = dict(self.__dict__)
-        try:
-            del state["twitter"]
-        except KeyError:
-            pass
+        state = super(RespondingFeed, self).__getstate__()
+        for name in ("twitter", "popularity", "eliza", "patterns",
+                     "reflections"):
+            state.pop(name, None)
         return state
 
-    def entries(self):
+    def apply(self, changes):
         """
-        Go through each of the mentions and if they're direct replies,
-        create an Eliza response and return it as a feed entry with
-        the mention's ID.
+        Replays the journaled mention cursor, along with the feed's
+        other changes.
+        """
+        for action, items in changes:
+            if action == "mentions_cursor":
+                self.since_id, self.max_id, self.newest_id = items
+        super(RespondingFeed, self).apply(changes)
+
+    def mentions(self):
+        """
+        Returns the mentions since the newest mention already read,
+        requesting pages of older mentions until there are none left,
+        up to a maximum number of pages, along with the ID to continue
+        from on the next call if the maximum was reached, or None. On
+        the first call, only the most recent page is requested. The
+        feed isn't changed, so this can be called while entries are
+        being queued and posted.
         """
-        entries = []
-        saved = self.saved()
         mentions = []
+        max_id = self.max_id
+        for _ in range(MENTIONS_MAX_PAGES):
+            page = self.twitter.GetMentions(count=MENTIONS_PER_PAGE,
+                                            since_id=self.since_id,
+                                            max_id=max_id)
+            mentions.extend(page)
+            if not page or self.since_id is None:
+                max_id = None
+                break
+            max_id = min([m.id for m in page]) - 1
+        else:
+            logging.warning("Mentions exceeded %s pages, continuing from "
+                            "%s on the next poll" % (MENTIONS_MAX_PAGES,
+                                                     max_id))
+        return mentions, max_id
+
+    def poll_mentions(self):
+        """
+        Returns the mentions and next ID from mentions(), or no
+        mentions and the current ID if requesting them fails.
+        """
         try:
-            mentions = self.twitter.GetMentions()
+            return self.mentions()
         except Exception, e:
             logging.error("Error getting mentions: %s" % e)
+            return [], self.max_id
+
+    def read_mentions(self, mentions, max_id):
+        """
+        Stores the ID to continue requesting mentions from, and moves
+        since_id to the newest mention found once there are no older
+        mentions left to request.
+        """
+        ids = [m.id for m in mentions]
+        if self.newest_id is not None:
+            ids.append(self.newest_id)
+        newest_id = max(ids) if ids else None
+        if max_id is None:
+            since_id = newest_id or self.since_id
+            newest_id = None
+        else:
+            since_id = self.since_id
+        cursor = (since_id, max_id, newest_id)
+        if cursor != (self.since_id, self.max_id, self.newest_id):
+            self.since_id, self.max_id, self.newest_id = cursor
+            self.journal.append(("mentions_cursor", cursor))
+
+    def mention_entries(self, polled=None):
+        """
+        Go through each of the mentions, as returned with the next ID
+        by poll_mentions(), which is called if they aren't given, and
+        if they're direct replies, create an Eliza response and return
+        it as an entry with the mention's ID.
+        """
+        entries = []
+        if polled is None:
+            polled = self.poll_mentions()
+        mentions, max_id = polled
+        self.read_mentions(mentions, max_id)
+        if self.popularity is not None:
+            self.popularity.statuses(mentions)
         for mention in mentions:
-            if mention.in_reply_to_screen_name and mention.id not in saved:
+            if mention.in_reply_to_screen_name and not self.seen(mention.id):
                 to_name = "@" + mention.in_reply_to_screen_name
                 from_name = "@" + mention.user.screen_name
                 # The mention is a reply if it starts with the same
@@ -64,50 +149,26 @@ class RespondingFeed(Feed):
                 text = mention.text[len(to_name) + 1:]
                 # Ignore links as they're probably spam.
                 if not reply or "http" in text.lower():
-                    self.done.add(mention.id)
+                    self.discard(mention.id)
                 else:
                     logging.debug("Reply found %s: %s" % (from_name, text))
-                    # Since the responses are partially random, try
-                    # up to 3 times if the response is too long.
-                    tries = 3
-                    while True:
-                        response = self.response(text)
-                        response_with_from = "%s %s" % (from_name, response)
-                        if len(response_with_from) > self.max_len:
-                            logging.debug("Response too long: %s" %
-                                          response_with_from)
-                            response = None
-                            tries -= 1
-                            if tries > 0:
-                                logging.debug("Retrying")
-                                continue
-                        break
-                    if response is not None:
+                    # Only use responses that fit with the username.
+                    max_len = self.max_len - len(from_name) - 1
+                    response = self.response(text, max_len)
+                    if response is None:
+                        logging.debug("No response short enough for: %s" %
+                                      text)
+                    else:
                         entries.append({
                             "id": mention.id,
                             "title": response,
                             "to": from_name
                         })
-        # Combine responses with feed entries, prioritizing responses
-        # over feed entries.
-        return entries + super(RespondingFeed, self).entries()
+        return entries
 
-    def response(self, text):
+    def response(self, text, max_len=None):
         """
         Matches the given text to one of the response patterns.
         Adopted from: http://www.jezuk.co.uk/cgi-bin/view/software/eliza
         """
-        for pattern, responses in self.patterns:
-            match = pattern.match(text)
-            if match:
-                response = choice(responses)
-                # Switch reflections.
-                for token in re.finditer("%\d", response):
-                    token = token.group()
-                    words = match.group(int(token[1:])).lower().split()
-                    reflected = [self.reflections.get(w, w) for w in words]
-                    response = re.sub(token, " ".join(reflected), response)
-                # Remove extraneous punctuation.
-                while len(response.rstrip(punctuation)) + 1 < len(response):
-                    response = response[:-2] + response[-1]
-                return response
+        return self.eliza.response(text, max_len)
@@ -0,0 +1,150 @@
+import logging
+from threading import Event, Lock
+from time import time
+
+from babbler.profiler import profiler
+
+
+# Seconds before running a task again after it fails in a pool, and
+# the longest to wait for a task in a pool to finish before checking
+# whether any tasks are due.
+ERROR_PAUSE = 60
+MAX_WAIT = 60
+
+# Seconds to wait for tasks running in a pool to finish once stopped.
+STOP_TIMEOUT = 30
+
+
+class Scheduler(object):
+    """
+    Runs named tasks on their own timers. Each task returns the number
+    of seconds until it should run again, and tasks can be woken to
+    run early. The clock and sleep functions can be given, so that the
+    scheduler can be run without waiting, otherwise waiting for the
+    next task is cut short by wake() and stop(). If a pool of threads is
+    given, due tasks are run in the pool, so that tasks that wait
+    don't hold up others. Each task only runs once at a time, and a
+    task woken while it's running runs again as soon as it finishes.
+    """
+
+    def __init__(self, clock=time, sleep=None, pool=None):
+        self.clock = clock
+        self.sleep = sleep
+        self.pool = pool
+        self.lock = Lock()
+        self.woken = Event()
+        self.tasks = {}
+        self.due = {}
+        self.rewake = set()
+        self.running = False
+
+    def add(self, name, task, delay=0):
+        """
+        Adds a task, first run after the given delay.
+        """
+        with self.lock:
+            self.tasks[name] = task
+            self.due[name] = self.clock() + delay
+
+    def wake(self, name):
+        """
+        Makes the task due now if it isn't already, or if it's running,
+        due once it finishes.
+        """
+        with self.lock:
+            if self.due[name] is None:
+                self.rewake.add(name)
+            else:
+                self.due[name] = min(self.due[name], self.clock())
+        self.woken.set()
+
+    def tick(self):
+        """
+        Runs each task that's due, in the order they became due, and
+        returns the seconds until the next task is due, or None if all
+        tasks are running in the pool.
+        """
+        now = self.clock()
+        with self.lock:
+            waiting = [n for n in self.due if self.due[n] is not None]
+            due = [n for n in sorted(waiting, key=self.due.get)
+                   if self.due[n] <= now]
+            for name in due:
+                self.due[name] = None
+        for name in due:
+            if self.pool is not None:
+                self.pool.apply_async(self.run_task, (name,))
+                continue
+            delay = ERROR_PAUSE
+            try:
+                delay = self.tasks[name]()
+            finally:
+                self.finish(name, delay)
+        with self.lock:
+            waiting = [d for d in self.due.values() if d is not None]
+        if waiting:
+            return max(min(waiting) - self.clock(), 0)
+
+    def run_task(self, name):
+        """
+        Runs a task in the pool, logging any error raised rather than
+        stopping the scheduler, and schedules it to run again.
+        """
+        try:
+            with profiler.profile(name):
+                delay = self.tasks[name]()
+        except Exception, e:
+            logging.exception("Error running %s: %s" % (name, e))
+            delay = ERROR_PAUSE
+        self.finish(name, delay)
+        self.woken.set()
+
+    def finish(self, name, delay):
+        """
+        Schedules a task that's finished to run again after the delay,
+        or now if it was woken while running.
+        """
+        with self.lock:
+            if name in self.rewake:
+                self.rewake.discard(name)
+                delay = 0
+            self.due[name] = self.clock() + delay
+
+    def run(self):
+        """
+        Runs tasks as they become due until stop() is called.
+        """
+        self.running = True
+        while self.running:
+            self.woken.clear()
+            with profiler.iteration(profile=self.pool is None):
+                pause = self.tick()
+            if not self.running or pause == 0:
+                continue
+            if self.sleep is not None:
+                self.sleep(pause)
+            else:
+                self.woken.wait(min(pause, MAX_WAIT) if pause else MAX_WAIT)
+
+    def stop(self, *args):
+        """
+        Stops running tasks once those running have finished. Takes
+        any args so that it can be used as a signal handler.
+        """
+        self.running = False
+        self.woken.set()
+
+    def join(self, timeout=STOP_TIMEOUT):
+        """
+        Waits up to the timeout for tasks running in the pool to
+        finish, returning the names of any still running.
+        """
+        deadline = self.clock() + timeout
+        while True:
+            self.woken.clear()
+            with self.lock:
+                running = [n for n in self.due if self.due[n] is None]
+            remaining = deadline - self.clock()
+            if not running or remaining <= 0:
+                return running
+            self.woken.wait(min(remaining, MAX_WAIT))
@@ -0,0 +1,128 @@
+from array import array
+from bisect import bisect_left
+from hashlib import md5
+from struct import unpack
+from time import time
+
+
+# Signed integer type code for the hash arrays, and the struct format
+# for unpacking a digest into a hash of the same width.
+TYPECODE = "l"
+WIDTH = array(TYPECODE).itemsize
+FORMAT = "<" + {4: "i", 8: "q"}[WIDTH]
+
+
+def fingerprint(entry_id):
+    """
+    Hashes an entry ID into a fixed-width integer. Feed entry IDs are
+    strings and mention IDs are integers, so they're prefixed to keep
+    them distinct.
+    """
+    if isinstance(entry_id, (int, long)):
+        entry_id = "i%s" % entry_id
+    elif isinstance(entry_id, unicode):
+        entry_id = "s" + entry_id.encode("utf-8")
+    else:
+        entry_id = "s" + entry_id
+    digest = md5(entry_id).digest()
+    return unpack(FORMAT, digest[:WIDTH])[0]
+
+
+class SeenSet(object):
+    """
+    Compact set of entry IDs that have been seen. IDs are stored as
+    fixed-width hashes, with recently added IDs in a regular set, which
+    is periodically sealed into a sorted array. Once an array is older
+    than the horizon it's discarded, so IDs are kept for at least the
+    horizon, or forever if the horizon is 0.
+    """
+
+    def __init__(self, ids=(), horizon=0, partitions=12):
+        self.horizon = horizon
+        self.partitions = partitions
+        self.current = set()
+        self.started = time()
+        self.sealed = []
+        self.update(ids)
+
+    def __getstate__(self):
+        """
+        Store the sealed arrays as strings, which pickle much faster
+        than arrays.
+        """
+        state = dict(self.__dict__)
+        state["sealed"] = [(t, a.tostring()) for t, a in self.sealed]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.sealed = [(t, array(TYPECODE, s)) for t, s in self.sealed]
+
+    def setup(self, horizon):
+        """
+        Set the horizon in seconds.
+        """
+        self.horizon = horizon
+        self.rotate()
+
+    def interval(self):
+        """
+        Seconds between sealing the current set into an array.
+        """
+        if self.horizon:
+            return float(self.horizon) / self.partitions
+        return 86400 * 30
+
+    def rotate(self):
+        """
+        Seal the current set if it's older than the interval, and
+        discard sealed arrays older than the horizon.
+        """
+        now = time()
+        if self.current and self.started + self.interval() < now:
+            self.sealed.append((now, array(TYPECODE, sorted(self.current))))
+            self.current = set()
+            self.started = now
+        if self.horizon:
+            expired = now - self.horizon
+            self.sealed = [(t, a) for t, a in self.sealed if t >= expired]
+
+    def add(self, entry_id):
+        self.rotate()
+        self.current.add(fingerprint(entry_id))
+
+    def update(self, ids):
+        for entry_id in ids:
+            self.add(entry_id)
+
+    def contains_hash(self, hashed):
+        if hashed in self.current:
+            return True
+        for _, hashes in self.sealed:
+            i = bisect_left(hashes, hashed)
+            if i < len(hashes) and hashes[i] == hashed:
+                return True
+        return False
+
+    def __contains__(self, entry_id):
+        return self.contains_hash(fingerprint(entry_id))
+
+    def touch(self, entry_id):
+        """
+        Returns True if the entry ID has been seen, and if so moves it
+        into the current set, so that IDs that keep appearing, such as
+        entries that remain in a feed, don't expire.
+        """
+        hashed = fingerprint(entry_id)
+        if hashed in self.current:
+            return True
+        if self.contains_hash(hashed):
+            self.current.add(hashed)
+            return True
+        return False
+
+    def __len__(self):
+        """
+        Number of hashes stored, which counts touched IDs again.
+        """
+        return len(self.current) + sum([len(a) for _, a in self.sealed])
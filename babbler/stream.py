@@ -0,0 +1,139 @@
+from os.path import abspath
+from urllib import pathname2url
+from urllib2 import BaseHandler, build_opener, HTTPError, Request
+from xml.parsers.expat import ExpatError, ParserCreate
+
+
+# Elements for entries in RSS and Atom feeds, and their IDs.
+ENTRY_ELEMENTS = ("item", "entry")
+ID_ELEMENTS = ("guid", "id")
+
+
+class StopParsing(Exception):
+    pass
+
+
+class TimeoutHandler(BaseHandler):
+    """
+    Sets the socket timeout for requests made by urllib2, for giving
+    to parse() or feedparser's parse function, which don't take a
+    timeout.
+    """
+
+    def __init__(self, timeout):
+        self.timeout = timeout
+
+    def http_request(self, request):
+        request.timeout = self.timeout
+        return request
+
+    https_request = http_request
+
+
+class EntryHandler(object):
+    """
+    Expat handlers that collect the ID and title of each entry in the
+    feed, raising StopParsing once the given number of consecutive
+    entries have been seen.
+    """
+
+    def __init__(self, seen, run):
+        self.seen = seen
+        self.run = run
+        self.consecutive = 0
+        self.entries = []
+        self.entry = None
+        self.entry_depth = None
+        self.depth = 0
+        self.text = []
+
+    def start(self, name, attrs):
+        name = name.rsplit(" ", 1)[-1]
+        self.depth += 1
+        if self.entry is None:
+            if name in ENTRY_ELEMENTS:
+                self.entry = {}
+                self.entry_depth = self.depth
+        elif self.depth == self.entry_depth + 1:
+            self.text = []
+            if name == "link" and "href" in attrs:
+                self.entry.setdefault("link", attrs["href"])
+
+    def end(self, name):
+        name = name.rsplit(" ", 1)[-1]
+        self.depth -= 1
+        if self.entry is None:
+            return
+        if self.depth == self.entry_depth:
+            text = "".join(self.text).strip()
+            if name in ID_ELEMENTS:
+                self.entry["id"] = text
+            elif text and name in ("title", "link"):
+                self.entry[name] = text
+        elif self.depth < self.entry_depth:
+            self.end_entry()
+
+    def end_entry(self):
+        entry, self.entry = self.entry, None
+        entry.setdefault("id", entry.get("link"))
+        entry.setdefault("title", u"")
+        self.entries.append(entry)
+        if self.seen(entry["id"]):
+            self.consecutive += 1
+            if self.consecutive >= self.run:
+                raise StopParsing()
+        else:
+            self.consecutive = 0
+
+    def data(self, text):
+        self.text.append(text)
+
+
+def parse(url, etag=None, modified=None, seen=None, run=3, chunk_size=8192,
+          handlers=None):
+    """
+    Alternative to feedparser's parse function that reads the feed
+    incrementally, and stops reading once the given run of consecutive
+    entries have been seen, as determined by the seen function. Only
+    the ID and title of each entry are parsed, with titles returned as
+    text. The return value is a dict that contains the same keys used
+    from feedparser's result. Extra urllib2 handlers can be given for
+    the request, as with feedparser.
+    """
+    result = {"entries": []}
+    if "://" not in url:
+        url = "file://" + pathname2url(abspath(url))
+    request = Request(url)
+    if etag:
+        request.add_header("If-None-Match", etag)
+    if modified:
+        request.add_header("If-Modified-Since", modified)
+    try:
+        response = build_opener(*(handlers or [])).open(request)
+    except HTTPError, e:
+        if e.code != 304:
+            raise
+        result["status"] = 304
+        return result
+    result["status"] = response.getcode() or 200
+    result["etag"] = response.info().getheader("ETag")
+    result["modified"] = response.info().getheader("Last-Modified")
+    handler = EntryHandler(seen or (lambda entry_id: False), run)
+    parser = ParserCreate(namespace_separator=" ")
+    parser.StartElementHandler = handler.start
+    parser.EndElementHandler = handler.end
+    parser.CharacterDataHandler = handler.data
+    try:
+        while True:
+            chunk = response.read(chunk_size)
+            parser.Parse(chunk, not chunk)
+            if not chunk:
+                break
+    except StopParsing:
+        pass
+    except ExpatError, e:
+        result["bozo_exception"] = e
+    finally:
+        response.close()
+    result["entries"] = handler.entries
+    return result
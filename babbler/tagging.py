@@ -1,38 +1,63 @@
 
 import logging
 from os.path import dirname, join
+import re
 from unicodedata import normalize
 
+from babbler.profiler import profiler
+from babbler.wordlist import WordList
+
+
+# Word lists loaded, keyed by index path, shared by all taggers.
+wordlists = {}
+
+# Characters removed from text before splitting it into words - all
+# but alphanumeric characters, apostrophes and spaces.
+NON_WORD = re.compile(r"[^\w' ]|_", re.UNICODE)
+
 
 class Tagger(object):
     """
     Extracts tags from text.
     """
 
-    def __init__(self, scorer, data_path, min_length):
+    def __init__(self, scorer, data_path, min_length, concurrency=1):
         """
-        Load dictionary and stopwords.
+        Load dictionary and stopwords from their compiled indexes,
+        which are shared with other taggers using the same indexes.
         """
         self.scorer = scorer
         self.min_length = min_length
+        self.concurrency = concurrency
+        self.pool = None
         for wordfile in ("dictionary", "stopwords"):
-            path = join(data_path, wordfile + ".txt")
-            with open(path) as f:
-                setattr(self, wordfile, set([s.strip() for s in f]))
+            source_path = join(data_path, wordfile + ".txt")
+            index_path = join(data_path, wordfile + ".idx")
+            if index_path not in wordlists:
+                wordlists[index_path] = WordList.load(source_path, index_path)
+            setattr(self, wordfile, wordlists[index_path])
 
-    def possible_for_index(self, words, i):
+    def possible_for_index(self, words, i, stop=None):
         """
         Returns up to 4 possible tags - all combinations of the next
         and previous words for the given index. If the word has a
-        possessive apostrophe, use the singular form.
+        possessive apostrophe, use the singular form. A dict can be
+        given for storing whether the word at each index is a stopword,
+        so that each word is only looked up once across indexes.
         """
+        if stop is None:
+            stop = {}
+        for j in (i - 1, i + 1):
+            if j not in stop and 0 <= j < len(words):
+                stop[j] = words[j] in self.stopwords
         prev = words[i - 1] if i > 0 else None
-        prev_valid = prev and prev not in self.stopwords
+        prev_valid = prev and not stop[i - 1]
         next = words[i + 1] if i < len(words) - 1 else None
-        next_valid = next and next not in self.stopwords
+        next_valid = next and not stop[i + 1]
         word = words[i]
+        lowered = word.lower()
         singular = [word[:len(end) * -1] for end in ("'s", "\xe2\x80\x99s")
-                    if word.lower().endswith(end)]
+                    if lowered.endswith(end)]
         if singular:
             word = singular[0]
         tags = [word]
@@ -48,15 +73,28 @@ class Tagger(object):
         # Remove apostophes.
         return [t.replace("'", "") for t in tags]
 
-    def best_with_score(self, tags):
+    def scores(self, tags):
+        """
+        Scores the unique tags concurrently using a pool of threads
+        bounded by the concurrency option, returning a dict of tags
+        mapped to scores.
+        """
+        unique = list(set(tags))
+        if self.pool is None:
+            from multiprocessing.pool import ThreadPool
+            self.pool = ThreadPool(self.concurrency)
+        return dict(zip(unique, self.pool.map(self.scorer, unique)))
+
+    def best_with_score(self, tags, scores=None):
         """
         Given possible tags, calculates a score for each, and returns
-        the highest scoring tag/score pair.
+        the highest scoring tag/score pair. Scores are looked up in the
+        given dict of pre-calculated scores if provided.
         """
         best = None
         highscore = 0
         for tag in tags:
-            score = self.scorer(tag)
+            score = scores[tag] if scores is not None else self.scorer(tag)
             logging.debug("Score for '%s': %s" % (tag, score))
             if score > highscore:
                 highscore = score
@@ -81,17 +119,52 @@ class Tagger(object):
            highest scoring tag to use from the possibilites for that word.
         4) Sort the chosen tags found for all words by score.
 
+        If the concurrency option is greater than 1, the possible tags
+        for all words are collected first and scored concurrently,
+        prior to the steps above.
+
         """
         logging.debug("Getting tags for: %s" % text)
+        with profiler.stage("tokenize"):
+            candidates = self.candidates(text, ascii)
+        with profiler.stage("score"):
+            tags = self.select(candidates)
+        logging.debug("Tags chosen: %s" % (", ".join(tags) or "None"))
+        return tags
+
+    def tags_many(self, texts, ascii=True):
+        """
+        Returns tags for each of the given texts, as returned by
+        tags(). The possible tags for all of the texts are scored
+        together, so that tags shared between texts are only scored
+        once, and concurrently if the concurrency option is greater
+        than 1.
+        """
+        with profiler.stage("tokenize"):
+            candidates = [self.candidates(text, ascii) for text in texts]
+        with profiler.stage("score"):
+            possible = [t for c in candidates for _, p in c for t in p]
+            if self.concurrency > 1:
+                scores = self.scores(possible)
+            else:
+                scores = dict([(t, self.scorer(t)) for t in set(possible)])
+            return [self.select(c, scores) for c in candidates]
+
+    def candidates(self, text, ascii=True):
+        """
+        Returns each word in the text that could be a tag, with its
+        possible tags.
+        """
         # Treat dashes and slashes as separators.
         text = unicode(text.replace("-", " ").replace("/", " "))
         # Translate unicode chars to ascii.
         if ascii:
             text = normalize("NFKD", text).encode("ascii", "ignore")
         # Initial list of alphanumeric words.
-        words = "".join([c for c in text if c.isalnum() or c in "' "]).split()
-        # All tags mapped to scores.
-        tags = {}
+        words = NON_WORD.sub("", text).split()
+        stop = {}
+        # Possible tags for each word.
+        candidates = []
         for i, word in enumerate(words):
             word = word.replace("'", "")
             # Ignore numbers and numeric positions, eg: '1st' or '44th'.
@@ -99,20 +172,33 @@ class Tagger(object):
                        word[:-2].isdigit()) or word.isdigit()
             too_short = len(word) < self.min_length
             if not (numeric or too_short or word.lower() in self.dictionary):
-                possible = self.possible_for_index(words, i)
-                logging.debug("Possible tags for the word '%s': %s" %
-                              (word, ", ".join(possible)))
-                # Check none of the possibilities have been used.
-                used = [t.lower() for t in tags.keys()]
-                if [t for t in possible if t.lower() in used]:
-                    logging.debug("Possible tags already used")
-                else:
-                    tag, score = self.best_with_score(possible)
-                    if tag is not None:
-                        logging.debug("Best tag for the word '%s': %s" %
-                                      (word, tag))
-                        tags[tag] = score
+                possible = self.possible_for_index(words, i, stop)
+                candidates.append((word, possible))
+        return candidates
+
+    def select(self, candidates, scores=None):
+        """
+        Returns the best scoring tag for each word's possible tags,
+        sorted by score. Scores are looked up in the given dict of
+        pre-calculated scores if provided.
+        """
+        if scores is None and self.concurrency > 1 and candidates:
+            scores = self.scores([t for _, p in candidates for t in p])
+        # All tags mapped to scores, and the lowercased tags used.
+        tags = {}
+        used = set()
+        for word, possible in candidates:
+            logging.debug("Possible tags for the word '%s': %s" %
+                          (word, ", ".join(possible)))
+            # Check none of the possibilities have been used.
+            if [t for t in possible if t.lower() in used]:
+                logging.debug("Possible tags already used")
+            else:
+                tag, score = self.best_with_score(possible, scores)
+                if tag is not None:
+                    logging.debug("Best tag for the word '%s': %s" %
+                                  (word, tag))
+                    tags[tag] = score
+                    used.add(tag.lower())
         # Sort tags by score.
-        tags = sorted(tags.keys(), key=lambda k: tags[k], reverse=True)
-        logging.debug("Tags chosen: %s" % (", ".join(tags) if tags else "None"))
-        return tags
+        return sorted(tags.keys(), key=lambda k: tags[k], reverse=True)
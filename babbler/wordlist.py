@@ -0,0 +1,80 @@
+import logging
+from mmap import mmap, ACCESS_READ
+from os import rename
+from os.path import exists, getmtime
+
+
+def compile_wordlist(source_path, index_path):
+    """
+    Compiles a text file of words, one per line, into a sorted index
+    of unique words that can be searched without loading it.
+    """
+    with open(source_path) as f:
+        words = sorted(set([s.strip() for s in f]) - set([""]))
+    tmp_path = index_path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write("\n" + "\n".join(words) + "\n")
+    rename(tmp_path, index_path)
+
+
+class WordList(object):
+    """
+    Set-like lookup of words in a compiled index, memory-mapped so
+    that the pages are shared between processes, and searched with a
+    binary search rather than being parsed.
+    """
+
+    def __init__(self, index_path):
+        with open(index_path, "rb") as f:
+            self.index = mmap(f.fileno(), 0, access=ACCESS_READ)
+
+    @classmethod
+    def load(cls, source_path, index_path):
+        """
+        Returns the word list for the index, compiling the source file
+        into the index first if it's missing or out of date. Falls back
+        to an in-memory set if the index can't be written.
+        """
+        stale = (not exists(index_path) or
+                 getmtime(index_path) < getmtime(source_path))
+        if stale:
+            try:
+                compile_wordlist(source_path, index_path)
+            except (IOError, OSError), e:
+                logging.error("Couldn't compile '%s': %s" % (index_path, e))
+                with open(source_path) as f:
+                    return set([s.strip() for s in f])
+        return cls(index_path)
+
+    def __contains__(self, word):
+        """
+        Binary search for the word. Each word in the index is preceded
+        and followed by a newline, so the word surrounding a position
+        is found by searching for the newlines either side of it.
+        """
+        if isinstance(word, unicode):
+            word = word.encode("utf-8")
+        index = self.index
+        low, high = 0, len(index) - 1
+        while low < high:
+            middle = (low + high) // 2
+            start = index.rfind("\n", low, middle + 1)
+            end = index.find("\n", middle + 1, high + 1)
+            if start == -1 or end == -1:
+                break
+            found = index[start + 1:end]
+            if word == found:
+                return True
+            elif word < found:
+                high = start
+            else:
+                low = end
+        return False
+
+
+if __name__ == "__main__":
+    from os.path import dirname, join
+    data_path = join(dirname(__file__), "data")
+    for name in ("dictionary", "stopwords"):
+        compile_wordlist(join(data_path, name + ".txt"),
+                         join(data_path, name + ".idx"))
@@ -0,0 +1,62 @@
+"""
+Measures deleting tweets with babbler.destroyer against a local fake
+Twitter API that adds latency to each request, for different numbers
+of workers.
+
+Run with: python -m benchmarks.destroy
+"""
+
+from os import close, remove
+from tempfile import mkstemp
+from threading import Lock
+from time import sleep
+
+
+class Tweet(object):
+
+    def __init__(self, id):
+        self.id = id
+
+
+class Twitter(object):
+    """
+    Fake timeline of tweets, where deleting every failing_every'th
+    tweet fails.
+    """
+
+    def __init__(self, count, latency, failing_every=100):
+        self.ids = set(range(1, count + 1))
+        self.latency = latency
+        self.failing_every = failing_every
+        self.lock = Lock()
+
+    def GetUserTimeline(self, count=20, max_id=None):
+        sleep(self.latency)
+        with self.lock:
+            ids = [i for i in self.ids if max_id is None or i <= max_id]
+        return [Tweet(i) for i in sorted(ids, reverse=True)[:count]]
+
+    def DestroyStatus(self, id):
+        sleep(self.latency)
+        if id % self.failing_every == 0:
+            raise Exception("Failed to delete %s" % id)
+        with self.lock:
+            self.ids.remove(id)
+
+
+def main(count=2000, latency=.005, workers=(1, 4, 8, 16)):
+    from babbler.destroyer import Destroyer
+    for worker_count in workers:
+        handle, path = mkstemp()
+        close(handle)
+        remove(path)
+        twitter = Twitter(count, latency)
+        deleted, _, errors, seconds = Destroyer(twitter, path,
+                                                workers=worker_count).run()
+        print "%2s workers: %s deleted, %s failed, %.2fs (%.0f per second)" % (
+            worker_count, deleted, sum(errors.values()), seconds,
+            deleted / seconds)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""
+Compares parsing large feeds with feedparser against babbler.stream,
+where all but the newest few entries have already been seen.
+
+Run with: python -m benchmarks.feeds
+"""
+
+from os import close, remove
+from tempfile import mkstemp
+from time import time
+
+from feedparser import parse
+
+from babbler import stream
+
+
+def write_feed(path, count):
+    """
+    Write an RSS feed with the given number of entries, newest first.
+    """
+    item = ("<item><guid>http://example.com/%(i)s</guid>"
+            "<title>Entry number %(i)s about something</title>"
+            "<link>http://example.com/%(i)s</link>"
+            "<description>%(description)s</description></item>")
+    description = "Lorem ipsum dolor sit amet. " * 20
+    with open(path, "wb") as f:
+        f.write('<?xml version="1.0"?><rss version="2.0"><channel>')
+        f.write("<title>Benchmark</title>")
+        for i in reversed(range(count)):
+            f.write(item % {"i": i, "description": description})
+        f.write("</channel></rss>")
+
+
+def timed(func, repeat):
+    """
+    Returns the average seconds for calling the function.
+    """
+    start = time()
+    for _ in range(repeat):
+        func()
+    return (time() - start) / repeat
+
+
+def main(sizes=(50, 200, 1000), new=5, repeat=5):
+    for count in sizes:
+        handle, path = mkstemp(suffix=".xml")
+        close(handle)
+        try:
+            write_feed(path, count)
+            seen = set(["http://example.com/%s" % i
+                        for i in range(count - new)])
+            full = timed(lambda: parse(path), repeat)
+            streamed = timed(lambda: stream.parse(path,
+                                                  seen=seen.__contains__),
+                             repeat)
+            print "%5s entries: feedparser %.4fs, stream %.4fs (%.0fx)" % (
+                count, full, streamed, full / streamed)
+        finally:
+            remove(path)
+
+
+if __name__ == "__main__":
+    main()
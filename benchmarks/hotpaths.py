@@ -0,0 +1,227 @@
+"""
+Measures the throughput and memory of the bot's hot paths offline,
+using synthetic feeds, mentions and "done" histories, and a
+deterministic hashtag scorer in place of Twitter searches. Results
+are written as JSON, and compared with a previous results file if
+one is given.
+
+Run with: python -m benchmarks.hotpaths [results.json] [baseline.json]
+"""
+
+from json import dump, load
+from os import close, remove
+from os.path import join
+from platform import python_version
+from resource import getrusage, RUSAGE_SELF
+from shutil import rmtree
+import sys
+from tempfile import mkdtemp, mkstemp
+from time import time
+from zlib import crc32
+
+from yaml import safe_load
+
+import babbler
+from babbler.bot import Bot
+from babbler.persistence import PersistentDict
+from babbler.responder import RespondingFeed
+from babbler.tagging import Tagger
+
+from benchmarks.feeds import write_feed
+
+
+WORDS = ("Government announces new funding for Sydney schools and "
+         "hospitals after the Prime Minister's visit to Melbourne "
+         "where Apple and Google unveiled technology partnerships").split()
+
+MENTIONS = ("I need a holiday", "Why can't you answer me", "I am sad",
+            "You are a robot", "Hello there", "Do you remember me",
+            "I feel like nobody listens", "What is the meaning of life")
+
+
+def titles(count):
+    """
+    Returns entry titles made from rotating slices of WORDS.
+    """
+    return [" ".join((WORDS * 2)[i % len(WORDS):][:12])
+            for i in range(count)]
+
+
+def scorer(tag):
+    """
+    Deterministic stand-in for Bot.hashtag_score.
+    """
+    return crc32(tag.lower().encode("utf-8")) & 0xffff
+
+
+class Mention(object):
+
+    def __init__(self, id, text):
+        self.id = id
+        self.text = "@babbler " + text
+        self.in_reply_to_screen_name = "babbler"
+        self.user = type("User", (object,), {"screen_name": "user%s" % id})
+
+
+class Twitter(object):
+    """
+    Returns the same set of mentions for each request.
+    """
+
+    def __init__(self, count):
+        self.mentions = [Mention(i, MENTIONS[i % len(MENTIONS)])
+                         for i in range(count, 0, -1)]
+
+    def GetMentions(self, **kwargs):
+        return [] if kwargs.get("max_id") else self.mentions
+
+
+def feed_options(feed_url, twitter):
+    """
+    Returns the default options for setting up a feed.
+    """
+    bot = Bot()
+    with open(bot.options_path) as f:
+        options = safe_load(f)["defaults"]
+    options.update(feed_url=feed_url, twitter=twitter, max_len=140,
+                   eliza_path=bot.eliza_path, ignore="sport,celebrity")
+    return options
+
+
+def make_feed(feed_url, done, mentions=0):
+    """
+    Returns a feed set up with the given number of seen entry IDs.
+    """
+    feed = RespondingFeed()
+    feed.done.update(["http://example.com/old/%s" % i for i in range(done)])
+    feed.setup(feed_options(feed_url, Twitter(mentions)))
+    return feed
+
+
+def measure(name, func, ops, repeat):
+    """
+    Calls the function repeat times, where each call performs the
+    given number of operations, returning the operations per second
+    and the growth in peak memory.
+    """
+    rss = getrusage(RUSAGE_SELF).ru_maxrss
+    start = time()
+    for _ in range(repeat):
+        func()
+    seconds = time() - start
+    result = {
+        "ops": ops * repeat,
+        "seconds": seconds,
+        "ops_per_second": ops * repeat / seconds if seconds else None,
+        "maxrss_growth_kb": getrusage(RUSAGE_SELF).ru_maxrss - rss,
+    }
+    print "%-32s %12.1f ops/s %8s KB" % (
+        name, result["ops_per_second"] or 0, result["maxrss_growth_kb"])
+    return result
+
+
+def bench_tagger(results, repeat):
+    tagger = Tagger(scorer=scorer, data_path=Bot().package_data_path,
+                    min_length=3)
+    texts = titles(200)
+    results["tagger.tags"] = measure("tagger.tags",
+                                     lambda: map(tagger.tags, texts),
+                                     len(texts), repeat)
+    results["tagger.tags_many"] = measure("tagger.tags_many",
+                                          lambda: tagger.tags_many(texts),
+                                          len(texts), repeat)
+
+
+def bench_feed(results, repeat, path, sizes=(1000, 100000)):
+    for done in sizes:
+        feed = make_feed(path, done)
+
+        def entries():
+            feed.polled.clear()
+            feed.entries()
+            feed.changes()
+        name = "feed.entries done=%s" % done
+        results[name] = measure(name, entries, 1, repeat)
+        feed.pool.terminate()
+
+
+def bench_responder(results, repeat, path, count=200):
+    feed = make_feed(path, 0, mentions=count)
+    texts = [MENTIONS[i % len(MENTIONS)] for i in range(count)]
+    results["responder.response"] = measure(
+        "responder.response", lambda: map(feed.response, texts),
+        count, repeat)
+
+    def mention_entries():
+        feed.since_id = None
+        feed.mention_entries()
+        feed.changes()
+    results["responder.mention_entries"] = measure(
+        "responder.mention_entries", mention_entries, count, repeat)
+    feed.pool.terminate()
+
+
+def bench_persistence(results, repeat, path, sizes=(1000, 100000)):
+    for done in sizes:
+        data_path = mkdtemp()
+        try:
+            data = PersistentDict(join(data_path, "babbler.data"))
+            data["feed"] = make_feed(path, done)
+            data.compact()
+            entries = [{"id": "new%s" % i, "title": t}
+                       for i, t in enumerate(titles(repeat))]
+
+            def save():
+                feed = data["feed"]
+                feed.queue([entries.pop()])
+                feed.process()
+                data.save()
+            name = "persistence.save done=%s" % done
+            results[name] = measure(name, save, 1, repeat)
+            name = "persistence.compact done=%s" % done
+            results[name] = measure(name, data.compact, 1, repeat)
+            data["feed"].pool.terminate()
+        finally:
+            rmtree(data_path)
+
+
+def compare(results, baseline_path):
+    """
+    Prints the ratio of each result's throughput to the baseline's.
+    """
+    with open(baseline_path) as f:
+        baseline = load(f)
+    print
+    print "Compared with %s (%s):" % (baseline_path, baseline["version"])
+    for name, result in sorted(results.items()):
+        previous = baseline["results"].get(name, {}).get("ops_per_second")
+        if previous and result["ops_per_second"]:
+            print "%-32s %.2fx" % (name, result["ops_per_second"] / previous)
+
+
+def main(results_path=None, baseline_path=None, repeat=20):
+    if results_path is None:
+        results_path = "benchmark-%s.json" % babbler.__version__
+    handle, path = mkstemp(suffix=".xml")
+    close(handle)
+    results = {}
+    try:
+        write_feed(path, 500)
+        bench_tagger(results, repeat)
+        bench_feed(results, repeat, path)
+        bench_responder(results, repeat, path)
+        bench_persistence(results, repeat, path)
+    finally:
+        remove(path)
+    with open(results_path, "w") as f:
+        dump({"version": babbler.__version__, "python": python_version(),
+              "time": time(), "results": results}, f, indent=2,
+             sort_keys=True)
+    print
+    print "Results written to %s" % results_path
+    if baseline_path:
+        compare(results, baseline_path)
+
+
+if __name__ == "__main__":
+    main(*sys.argv[1:])
@@ -0,0 +1,69 @@
+"""
+Measures the startup time of each of the entry modes in babbler.main,
+by running each in a new process from a temporary data directory.
+
+Run with: python -m benchmarks.startup
+"""
+
+from os import environ, getcwd
+from os.path import join
+from shutil import rmtree
+from subprocess import PIPE, Popen
+import sys
+from tempfile import mkdtemp
+from time import time
+
+
+MAIN = "import babbler; babbler.main()"
+
+# Sets up the bot for running without entering the main loop.
+RUN = ("import sys; from babbler.bot import Bot; bot = Bot(); bot.load(); "
+       "bot.twitter; bot.start()")
+
+# Options required to create a data file, and the value of stdin
+# for prompts in each mode.
+SETUP = ["-w", "key", "-x", "secret", "-y", "key", "-z", "secret"]
+
+MODES = (
+    ("kill", MAIN, ["-k"], ""),
+    ("kill with options", MAIN, ["-k", "-l", "ERROR"], ""),
+    ("version", MAIN, ["--version"], ""),
+    ("help", MAIN, ["-h"], ""),
+    ("edit data", MAIN, ["-e"], ""),
+    ("destroy (aborted)", MAIN, ["-D"], "n\n"),
+    ("run (setup only)", RUN, ["-l", "ERROR"], ""),
+)
+
+
+def run(code, args, stdin, cwd):
+    """
+    Returns the seconds taken to run the code in a new process, or
+    raises an error if the process fails.
+    """
+    env = dict(environ, PYTHONPATH=getcwd())
+    start = time()
+    process = Popen([sys.executable, "-c", code] + args, cwd=cwd, env=env,
+                    stdin=PIPE, stdout=PIPE, stderr=PIPE)
+    _, error = process.communicate(stdin)
+    if process.returncode:
+        raise RuntimeError("%s failed:\n%s" % (" ".join(args), error))
+    return time() - start
+
+
+def main(repeat=5):
+    data_path = mkdtemp()
+    try:
+        feed_path = join(data_path, "feed.xml")
+        # Create the data file with a mode that loads it - killing
+        # returns before loading data.
+        run(MAIN, ["-u", feed_path, "-e"] + SETUP, "", data_path)
+        for name, code, args, stdin in MODES:
+            times = [run(code, args, stdin, data_path) for _ in range(repeat)]
+            print "%-20s min %.3fs, mean %.3fs" % (name, min(times),
+                                                  sum(times) / len(times))
+    finally:
+        rmtree(data_path)
+
+
+if __name__ == "__main__":
+    main()
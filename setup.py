@@ -1,7 +1,24 @@
 
+from os.path import join
+
 from setuptools import setup, find_packages
+from setuptools.command.build_py import build_py
 
 import babbler
+from babbler.wordlist import compile_wordlist
+
+
+class BuildWithWordLists(build_py):
+    """
+    Compiles the dictionary and stopword indexes into the build.
+    """
+
+    def run(self):
+        build_py.run(self)
+        data_path = join(self.build_lib, "babbler", "data")
+        for name in ("dictionary", "stopwords"):
+            compile_wordlist(join(data_path, name + ".txt"),
+                             join(data_path, name + ".idx"))
 
 
 setup(
@@ -16,6 +33,7 @@ setup(
     include_package_data=True,
     packages=find_packages(),
     install_requires=[r.strip() for r in open("requirements.txt") if r],
+    cmdclass={"build_py": BuildWithWordLists},
     entry_points="""
         [console_scripts]
         babbler=babbler:main
@@ -0,0 +1,97 @@
+from os import devnull
+from shutil import rmtree
+import sys
+from tempfile import mkdtemp
+from time import time
+from unittest import TestCase
+
+from babbler.bot import Bot
+from babbler.popularity import PopularityIndex
+from babbler.responder import RespondingFeed
+
+
+ARGS = ["--feed-url", "http://example.com/rss", "--consumer-key", "key",
+        "--consumer-secret", "secret", "--access-token-key", "key",
+        "--access-token-secret", "secret"]
+
+
+def load_bot(path):
+    """
+    Returns a bot with its data loaded from the directory, with the
+    messages printed on initial setup hidden.
+    """
+    bot = Bot(path=path)
+    stdout, sys.stdout = sys.stdout, open(devnull, "w")
+    try:
+        bot.load(ARGS)
+    finally:
+        sys.stdout = stdout
+    return bot
+
+
+class BotTests(TestCase):
+
+    def setUp(self):
+        self.path = mkdtemp()
+
+    def tearDown(self):
+        rmtree(self.path)
+
+    def loaded(self):
+        return load_bot(self.path)
+
+    def save_feed(self, compact):
+        bot = self.loaded()
+        feed = bot.data["feed"] = RespondingFeed()
+        bot.data.save()
+        feed.queue([{"id": "1", "title": "Reply to a mention", "to": "@a"},
+                    {"id": "2", "title": "Entry from the feed"}])
+        feed.feed_entries("http://example.com/rss",
+                          {"etag": "abc", "modified": "yesterday",
+                           "entries": []})
+        feed.read_mentions([], 10)
+        if compact:
+            bot.data.compact()
+        else:
+            bot.data.save()
+
+    def assertFeedLoaded(self):
+        feed = self.loaded().data["feed"]
+        self.assertEqual([e["id"] for e in feed.replies], ["1"])
+        self.assertEqual([e["id"] for e in feed.todo], ["2"])
+        self.assertEqual(feed.validators,
+                         {"http://example.com/rss": ("abc", "yesterday")})
+        self.assertEqual(feed.max_id, 10)
+        self.assertEqual(feed.titles.match("Entry from the feed"),
+                         "Entry from the feed")
+
+    def test_load_journaled_feed(self):
+        """
+        The feed's queues, validators, mentions cursor and titles are
+        loaded from the journal.
+        """
+        self.save_feed(compact=False)
+        self.assertFeedLoaded()
+
+    def test_load_compacted_feed(self):
+        """
+        The feed's queues, validators, mentions cursor and titles are
+        loaded from the compacted data file.
+        """
+        self.save_feed(compact=True)
+        self.assertFeedLoaded()
+
+    def test_compose_after_search(self):
+        """
+        An entry composed while its hashtags were waiting to be
+        searched for is composed again once they've been searched.
+        """
+        bot = self.loaded()
+        bot.data["popularity"] = popularity = PopularityIndex()
+        bot.compose = lambda entry: ("Entry #Tagged", None)
+        popularity.want("Tagged")
+        entry = {"id": "1", "title": "Entry", "tweet": "Entry",
+                 "composed": time(), "wanted": ["Tagged"]}
+        self.assertEqual(bot.composed(entry), ("Entry", None))
+        popularity.searched("Tagged")
+        self.assertEqual(bot.composed(entry), ("Entry #Tagged", None))
@@ -0,0 +1,53 @@
+from os import close, remove
+from tempfile import mkstemp
+from unittest import TestCase
+
+from babbler.destroyer import Destroyer
+
+
+class Tweet(object):
+
+    def __init__(self, id):
+        self.id = id
+
+
+class Twitter(object):
+    """
+    Fake user timeline, returning pages newest first.
+    """
+
+    def __init__(self, ids):
+        self.ids = set(ids)
+
+    def GetUserTimeline(self, count, max_id=None):
+        ids = [i for i in self.ids if max_id is None or i <= max_id]
+        return [Tweet(i) for i in sorted(ids, reverse=True)[:count]]
+
+    def DestroyStatus(self, id):
+        self.ids.remove(id)
+
+
+class DestroyerTests(TestCase):
+
+    def setUp(self):
+        handle, self.path = mkstemp()
+        close(handle)
+
+    def tearDown(self):
+        try:
+            remove(self.path)
+        except OSError:
+            pass
+
+    def test_resume(self):
+        """
+        A resumed run reports the tweets it deleted separately from
+        the total deleted by earlier runs.
+        """
+        with open(self.path, "w") as f:
+            f.write("6 4")
+        twitter = Twitter(range(1, 7))
+        destroyer = Destroyer(twitter, self.path, workers=2, page_size=4)
+        deleted, total, errors, _ = destroyer.run()
+        self.assertEqual((deleted, total, errors), (6, 10, {}))
+        self.assertEqual(twitter.ids, set())
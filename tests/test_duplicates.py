@@ -0,0 +1,75 @@
+from pickle import dumps, loads
+from unittest import TestCase
+
+from babbler.duplicates import TitleIndex
+
+
+class TitleIndexTests(TestCase):
+
+    def setUp(self):
+        self.index = TitleIndex()
+
+    def test_distinct_similar_titles(self):
+        """
+        Distinct titles that only differ by a word or number aren't
+        near duplicates.
+        """
+        titles = ["Entry number %s about something" % i for i in range(500)]
+        titles += ["Live: Sydney weather update #1",
+                   "Live: Sydney weather update #2",
+                   "Live: Sydney weather update #3"]
+        for title in titles:
+            self.assertEqual(self.index.match(title), None, title)
+            self.index.add(title)
+        self.assertEqual(len(self.index), len(titles))
+
+    def test_near_duplicates(self):
+        """
+        Titles that only differ by case, punctuation and URLs, or by
+        a word, are near duplicates, and the title matched is returned.
+        """
+        title = (u"Apple announces new iPhone with faster chip and better "
+                 u"camera")
+        self.index.add(title)
+        for duplicate in (
+                u"apple announces new iphone, with faster chip and better "
+                u"camera!",
+                u"Apple announces new iPhone with faster chip and better "
+                u"camera http://example.com/iphone",
+                u"Apple announces new iPhone with a faster chip and better "
+                u"camera",
+                u"Apple announces new iPhone with faster chip and bigger "
+                u"camera",
+                u"Apple announces new iPhone with faster chip and better "
+                u"camera - Reuters",
+                u"Apple announces new iPhone with faster chip, better camera"):
+            self.assertEqual(self.index.match(duplicate), title)
+        self.assertEqual(self.index.match(u"Apple announces new iPad"),
+                         None)
+
+    def test_exact(self):
+        """
+        With a similarity of 1, only titles with the same words are
+        near duplicates.
+        """
+        self.index.setup(size=10, similarity=1)
+        self.index.add(u"Apple announces new iPhone")
+        self.assertEqual(self.index.match(u"apple: new iPhone announces"),
+                         u"Apple announces new iPhone")
+        self.assertEqual(self.index.match(u"Apple announces new iPhone 7"),
+                         None)
+
+    def test_size(self):
+        """
+        The oldest titles are removed once the size is reached, and the
+        index survives pickling.
+        """
+        self.index.setup(size=2, similarity=0.75)
+        for title in ("First title here", "Second title here",
+                      "Third title here"):
+            self.index.add(title)
+        index = loads(dumps(self.index))
+        self.assertEqual(len(index), 2)
+        self.assertEqual(index.match("First title here"), None)
+        self.assertEqual(index.match("Third title here"),
+                         "Third title here")
@@ -0,0 +1,131 @@
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from shutil import rmtree
+from SocketServer import ThreadingMixIn
+from tempfile import mkdtemp
+from threading import Event, Thread
+from unittest import TestCase
+
+from babbler.feed import Feed
+from babbler.responder import RespondingFeed
+from tests.test_bot import load_bot
+
+
+RSS = """<?xml version="1.0"?>
+<rss version="2.0"><channel><title>Feed</title>
+<item><guid>1</guid><title>First entry in the feed</title></item>
+<item><guid>2</guid><title>Second entry in the feed</title></item>
+</channel></rss>"""
+
+
+def parsed(*titles):
+    """
+    Returns a parsed feed with entries for the titles, newest first.
+    """
+    return {"entries": [{"id": title, "title": title} for title in titles]}
+
+
+class Handler(BaseHTTPRequestHandler):
+    """
+    Serves the feed with an ETag, or a 304 response if the request
+    has the same ETag. Requests for /slow don't respond until the
+    server is stopped.
+    """
+
+    def do_GET(self):
+        etag = self.headers.get("If-None-Match")
+        self.server.requests.append(etag)
+        if self.path == "/slow":
+            self.server.stopped.wait(10)
+            return
+        if etag == '"v1"':
+            self.send_response(304)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "application/rss+xml")
+        self.send_header("ETag", '"v1"')
+        self.end_headers()
+        self.wfile.write(RSS)
+
+    def log_message(self, *args):
+        pass
+
+
+class Server(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class FeedRequestTests(TestCase):
+
+    def setUp(self):
+        self.path = mkdtemp()
+        self.server = Server(("127.0.0.1", 0), Handler)
+        self.server.requests = []
+        self.server.stopped = Event()
+        Thread(target=self.server.serve_forever).start()
+        self.url = "http://127.0.0.1:%s/rss" % self.server.server_port
+
+    def tearDown(self):
+        self.server.stopped.set()
+        self.server.shutdown()
+        self.server.server_close()
+        rmtree(self.path)
+
+    def loaded(self):
+        bot = load_bot(self.path)
+        bot.data.setdefault("feed", RespondingFeed())
+        options = dict(bot.data["options"], feed_url=self.url, max_len=140,
+                       twitter=None, eliza_path=bot.eliza_path)
+        bot.data["feed"].setup(options)
+        return bot
+
+    def test_not_modified_after_reload(self):
+        """
+        The feed's ETag is sent once the bot's data is loaded again,
+        and the 304 response has no entries.
+        """
+        bot = self.loaded()
+        feed = bot.data["feed"]
+        feed.queue(feed.entries(feed.poll()))
+        self.assertEqual([e["title"] for e in feed.todo],
+                         ["Second entry in the feed",
+                          "First entry in the feed"])
+        bot.data.save()
+        feed = self.loaded().data["feed"]
+        self.assertEqual(feed.entries(feed.poll()), [])
+        self.assertEqual(self.server.requests, [None, '"v1"'])
+
+    def test_timeout(self):
+        """
+        A feed that doesn't respond within its own timeout is dropped,
+        and its request times out, so that it's requested again.
+        """
+        self.url = self.url.replace("/rss", "/slow|0|1")
+        feed = self.loaded().data["feed"]
+        self.assertEqual(feed.feeds[0][1:], (0, 1))
+        self.assertEqual(feed.poll(), [])
+        self.assertEqual(feed.poll(), [])
+        self.assertEqual(len(self.server.requests), 2)
+
+
+class EntriesTests(TestCase):
+
+    def test_duplicates(self):
+        """
+        Entries that are near duplicates of earlier entries from any
+        feed are dropped, and titles are indexed once queued.
+        """
+        feed = Feed()
+        feed.max_len = 140
+        polled = [("a", parsed("Apple announces new iPhone today",
+                               "Sydney weather update")),
+                  ("b", parsed("Apple announces a new iPhone today"))]
+        entries = feed.entries(polled)
+        self.assertEqual([e["title"] for e in entries],
+                         ["Sydney weather update",
+                          "Apple announces a new iPhone today"])
+        self.assertEqual(len(feed.titles), 0)
+        feed.queue(entries)
+        self.assertEqual(len(feed.titles), 2)
+        polled = [("a", parsed("Apple announces new iPhone today!"))]
+        self.assertEqual(feed.entries(polled), [])
@@ -0,0 +1,60 @@
+from os.path import getsize, join
+from shutil import rmtree
+from tempfile import mkdtemp
+from unittest import TestCase
+
+from babbler.persistence import PersistentDict
+
+
+class PersistentDictTests(TestCase):
+
+    def setUp(self):
+        self.path = mkdtemp()
+        self.data_path = join(self.path, "babbler.data")
+
+    def tearDown(self):
+        rmtree(self.path)
+
+    def loaded(self):
+        data = PersistentDict(self.data_path)
+        data.load()
+        return data
+
+    def truncate_journal(self, size):
+        journal_path = self.data_path + ".journal"
+        with open(journal_path, "r+b") as f:
+            f.truncate(getsize(journal_path) - size)
+
+    def test_save_after_truncated_journal(self):
+        """
+        Records saved after loading a journal ending in an incomplete
+        record are loaded.
+        """
+        data = self.loaded()
+        data["a"] = 1
+        data.compact()
+        data["b"] = range(100)
+        data.save()
+        self.truncate_journal(20)
+        data = self.loaded()
+        self.assertEqual(data, {"a": 1})
+        for key in ("c", "d", "e"):
+            data[key] = key
+            data.save()
+        self.assertEqual(self.loaded(), {"a": 1, "c": "c", "d": "d",
+                                         "e": "e"})
+
+    def test_save_after_corrupt_journal(self):
+        """
+        Records saved after loading a journal ending in bytes that
+        can't be unpickled are loaded.
+        """
+        data = self.loaded()
+        data["a"] = 1
+        data.save()
+        with open(self.data_path + ".journal", "ab") as f:
+            f.write("garbage")
+        data = self.loaded()
+        data["b"] = 2
+        data.save()
+        self.assertEqual(self.loaded(), {"a": 1, "b": 2})
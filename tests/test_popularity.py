@@ -0,0 +1,27 @@
+from pickle import dumps, loads
+from threading import Thread
+from unittest import TestCase
+
+from babbler.popularity import PopularityIndex
+
+
+class PopularityIndexTests(TestCase):
+
+    def test_pickle_while_changing(self):
+        """
+        The index can be pickled while tags are being added by another
+        thread.
+        """
+        popularity = PopularityIndex(size=100000)
+        popularity.seen([("tag%s" % i, 1000) for i in range(1000)])
+
+        def want():
+            for i in range(20000):
+                popularity.want("wanted%s" % i)
+
+        thread = Thread(target=want)
+        thread.start()
+        while thread.is_alive():
+            loads(dumps(popularity))
+        thread.join()
+        self.assertEqual(len(loads(dumps(popularity))), 21000)
@@ -0,0 +1,26 @@
+from threading import Timer
+from time import time
+from unittest import TestCase
+
+from babbler.ratelimit import RateLimited, RateLimitedApi
+
+
+class Twitter(object):
+
+    def PostUpdate(self, status):
+        return status
+
+
+class RateLimitedApiTests(TestCase):
+
+    def test_stop_while_waiting(self):
+        """
+        A request waiting for its rate limit raises RateLimited as soon
+        as the API is stopped.
+        """
+        api = RateLimitedApi(Twitter())
+        api.buckets["PostUpdate"].tokens = 0
+        Timer(.1, api.stopped.set).start()
+        start = time()
+        self.assertRaises(RateLimited, api.PostUpdate, "tweet")
+        self.assertTrue(time() - start < 5)
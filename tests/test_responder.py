@@ -0,0 +1,103 @@
+from shutil import rmtree
+from tempfile import mkdtemp
+from unittest import TestCase
+
+from babbler import responder
+from babbler.responder import RespondingFeed
+from tests.test_bot import load_bot
+
+
+class Mention(object):
+
+    def __init__(self, id):
+        self.id = id
+        self.in_reply_to_screen_name = None
+
+
+class Twitter(object):
+    """
+    Fake mentions timeline, returning pages newest first.
+    """
+
+    def __init__(self, ids):
+        self.ids = list(ids)
+
+    def GetMentions(self, count=20, since_id=None, max_id=None):
+        ids = [i for i in self.ids if (since_id is None or i > since_id)
+               and (max_id is None or i <= max_id)]
+        return [Mention(i) for i in sorted(ids, reverse=True)[:count]]
+
+
+class MentionsTests(TestCase):
+
+    def setUp(self):
+        self.per_page = responder.MENTIONS_PER_PAGE
+        self.max_pages = responder.MENTIONS_MAX_PAGES
+        responder.MENTIONS_PER_PAGE = 2
+        responder.MENTIONS_MAX_PAGES = 2
+        self.feed = RespondingFeed()
+        self.feed.popularity = None
+        self.feed.twitter = Twitter([1])
+
+    def tearDown(self):
+        responder.MENTIONS_PER_PAGE = self.per_page
+        responder.MENTIONS_MAX_PAGES = self.max_pages
+
+    def poll(self):
+        mentions, max_id = self.feed.poll_mentions()
+        self.feed.mention_entries((mentions, max_id))
+        return [m.id for m in mentions]
+
+    def test_continue_past_max_pages(self):
+        """
+        Mentions beyond the maximum number of pages are requested on
+        the following polls, and since_id only moves to the newest
+        mention once they've all been read.
+        """
+        self.assertEqual(self.poll(), [1])
+        self.feed.twitter.ids.extend(range(2, 12))
+        self.assertEqual(self.poll(), [11, 10, 9, 8])
+        self.assertEqual(self.feed.since_id, 1)
+        self.feed.twitter.ids.append(12)
+        self.assertEqual(self.poll(), [7, 6, 5, 4])
+        self.assertEqual(self.feed.since_id, 1)
+        self.assertEqual(self.poll(), [3, 2])
+        self.assertEqual(self.feed.since_id, 11)
+        self.assertEqual(self.poll(), [12])
+        self.assertEqual(self.feed.since_id, 12)
+        self.assertEqual(self.poll(), [])
+
+    def test_journaled_cursor(self):
+        """
+        The cursor is restored by replaying the journal.
+        """
+        self.poll()
+        self.feed.twitter.ids.extend(range(2, 12))
+        self.poll()
+        feed = RespondingFeed()
+        feed.apply(self.feed.changes())
+        self.assertEqual((feed.since_id, feed.max_id, feed.newest_id),
+                         (1, 7, 11))
+
+    def test_reloaded_cursor(self):
+        """
+        Mentions beyond the maximum number of pages are still read
+        after the bot's data is saved and loaded again part way
+        through.
+        """
+        path = mkdtemp()
+        try:
+            bot = load_bot(path)
+            bot.data["feed"] = self.feed
+            self.poll()
+            self.feed.twitter.ids.extend(range(2, 12))
+            read = self.poll()
+            bot.data.save()
+            self.feed, twitter = load_bot(path).data["feed"], self.feed.twitter
+            self.feed.popularity = None
+            self.feed.twitter = twitter
+            read += self.poll() + self.poll()
+            self.assertEqual(sorted(read), range(2, 12))
+            self.assertEqual(self.feed.since_id, 11)
+        finally:
+            rmtree(path)
@@ -0,0 +1,93 @@
+from multiprocessing.pool import ThreadPool
+from threading import Event, Thread, Timer
+from time import time
+from unittest import TestCase
+
+from babbler.scheduler import Scheduler
+
+
+class Clock(object):
+    """
+    Clock that only moves when told to.
+    """
+
+    def __init__(self):
+        self.now = 1000.
+
+    def __call__(self):
+        return self.now
+
+
+class SchedulerTests(TestCase):
+
+    def test_wake_while_running(self):
+        """
+        A task woken while running in the pool is due as soon as it
+        finishes, rather than after its delay.
+        """
+        clock = Clock()
+        scheduler = Scheduler(clock=clock, pool=ThreadPool(1))
+        started, release = Event(), Event()
+
+        def task():
+            started.set()
+            release.wait(5)
+            return 600
+
+        scheduler.add("task", task)
+        scheduler.tick()
+        self.assertTrue(started.wait(5))
+        scheduler.wake("task")
+        release.set()
+        self.assertEqual(scheduler.join(5), [])
+        self.assertEqual(scheduler.due["task"], clock.now)
+        # Without being woken, the task's delay applies.
+        started.clear()
+        scheduler.tick()
+        self.assertTrue(started.wait(5))
+        self.assertEqual(scheduler.join(5), [])
+        self.assertEqual(scheduler.due["task"], clock.now + 600)
+
+    def test_wake_self_without_pool(self):
+        """
+        A task that wakes itself while running is due straight away.
+        """
+        clock = Clock()
+        scheduler = Scheduler(clock=clock)
+
+        def task():
+            scheduler.wake("task")
+            return 600
+
+        scheduler.add("task", task)
+        self.assertEqual(scheduler.tick(), 0)
+        self.assertEqual(scheduler.due["task"], clock.now)
+
+    def test_error_without_pool(self):
+        """
+        A task that raises an error without a pool isn't left marked
+        as running.
+        """
+        scheduler = Scheduler(clock=Clock())
+
+        def task():
+            raise ValueError
+
+        scheduler.add("task", task)
+        self.assertRaises(ValueError, scheduler.tick)
+        self.assertEqual(scheduler.join(0), [])
+
+    def test_stop_while_waiting(self):
+        """
+        Waiting for the next task to be due ends as soon as the
+        scheduler is stopped.
+        """
+        scheduler = Scheduler()
+        scheduler.add("task", lambda: 600)
+        thread = Thread(target=scheduler.run)
+        start = time()
+        thread.start()
+        Timer(.1, scheduler.stop).start()
+        thread.join(5)
+        self.assertFalse(thread.is_alive())
+        self.assertTrue(time() - start < 5)